@@ -7,7 +7,6 @@ handling authentication, request formatting, and error handling consistently.
 import requests
 import time
 import logging
-import json
 import threading
 from typing import Dict, Any, Optional, Union, List, Tuple
 
@@ -8,7 +8,6 @@ import uuid
 import time
 import threading
 import logging
-import json
 from dataclasses import dataclass, field
 from typing import Dict, Any, Callable, List, Optional, Union, TypeVar, Generic
 
@@ -0,0 +1,180 @@
+"""
+Shared helpers for modules that call the Box AI REST API directly.
+This module provides the JSON codec, access token and header helpers, the pooled
+HTTP session, the in-process TTL cache and the file info lookup used by
+categorization and extraction.
+"""
+
+import json
+import time
+import hashlib
+import functools
+import threading
+import requests
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# orjson is a faster JSON codec; fall back to the stdlib when it's absent.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the same type.
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> bytes:
+        """
+        Encode obj as compact UTF-8 JSON bytes, as orjson.dumps does
+        """
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+# Shared HTTP session so Box AI calls from all modules and worker threads reuse pooled
+# TLS connections. Connection errors and transient 429/5xx responses are retried with
+# exponential backoff (up to BOX_AI_MAX_ATTEMPTS attempts in all), waiting as long as a
+# Retry-After header asks. Read timeouts are not retried: a POST that timed out may
+# still be running on Box, and retrying it would hold the caller for several read
+# timeouts. The pool is sized for categorization and extraction workers running at
+# the same time. The timeout keeps a hung request from blocking a script run
+# indefinitely; extraction of long documents needs the long read timeout.
+BOX_AI_TIMEOUT = (5, 120)  # (connect, read) seconds
+BOX_AI_MAX_ATTEMPTS = 5
+BOX_AI_POOL_SIZE = 64
+http_session = requests.Session()
+http_session.mount("https://", requests.adapters.HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=BOX_AI_POOL_SIZE,
+    max_retries=Retry(
+        total=BOX_AI_MAX_ATTEMPTS - 1,
+        read=False,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+))
+
+def get_access_token(client) -> str:
+    """
+    Get the current access token from a Box client
+
+    Raises:
+        ValueError: If there is no client or it exposes no access token
+    """
+    if client is None:
+        raise ValueError("No Box client in session state; authenticate first")
+
+    access_token = None
+    if hasattr(client, "_oauth"):
+        access_token = client._oauth.access_token
+    elif hasattr(client, "auth") and hasattr(client.auth, "access_token"):
+        access_token = client.auth.access_token
+
+    if not access_token:
+        raise ValueError("Could not retrieve access token from client")
+    return access_token
+
+def caller_id(access_token: str) -> str:
+    """
+    Opaque identity of the caller for in-process cache keys. It is derived from the
+    access token, so Box data cached for one session is never returned to another.
+    """
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:32]
+
+@functools.lru_cache(maxsize=8)
+def box_ai_headers(access_token: str) -> Dict[str, str]:
+    """
+    Request headers for Box AI calls, built once per access token.
+    The dict is shared between calls, so callers must not modify it.
+    """
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache of dict values that expire after ttl seconds.
+    Values are copied on the way in and out, so callers may modify what they get.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds an entry is returned after it was stored
+            max_entries: Entries kept before the least recently used are evicted
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Get a copy of a cached value, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry[1])
+
+    def set(self, key: Hashable, value: Dict[str, Any]) -> None:
+        """
+        Store a copy of value, evicting the least recently used entries beyond max_entries
+        """
+        with self._lock:
+            self._entries[key] = (time.time(), dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# Box file info (version, size, name, extension) keyed on (caller, file), so one
+# session's lookups are never answered from another's. The short TTL lets the cache
+# keys of a run share one lookup per file while still noticing new uploads.
+FILE_INFO_TTL = 60
+FILE_INFO_MAX_ENTRIES = 4096
+_FILE_INFO_FIELDS = "file_version,size,name,extension"
+_file_info_cache = TTLCache(FILE_INFO_TTL, FILE_INFO_MAX_ENTRIES)
+
+def get_file_info(file_id: str, access_token: str) -> Dict[str, Any]:
+    """
+    Get a file's current version, size, name and extension with one plain REST call,
+    so worker threads need only the access token and not the session's client.
+    Answers are reused for FILE_INFO_TTL seconds for the same caller.
+
+    Raises:
+        requests.HTTPError: If Box rejects the request
+    """
+    info_key = (caller_id(access_token), file_id)
+    file_info = _file_info_cache.get(info_key)
+    if file_info is not None:
+        return file_info
+
+    response = http_session.get(
+        f"https://api.box.com/2.0/files/{file_id}",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"fields": _FILE_INFO_FIELDS},
+        timeout=BOX_AI_TIMEOUT
+    )
+    response.raise_for_status()
+    file_info = json_loads(response.content)
+
+    _file_info_cache.set(info_key, file_info)
+    return file_info
+
+def file_version_id(file_info: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Current version ID from a file info dict, or None if it is unknown
+    """
+    if file_info and file_info.get("file_version"):
+        return file_info["file_version"].get("id")
+    return None
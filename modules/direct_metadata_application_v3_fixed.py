@@ -8,16 +8,37 @@
 import streamlit as st
 import logging
 import json
+import os
+import concurrent.futures
+import hashlib
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
 from boxsdk import Client, exception
 from boxsdk.object.metadata import MetadataUpdate # Import MetadataUpdate
 from dateutil import parser
 from datetime import timezone
+from modules.box_ai import json_loads
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Debug mode flag: the sidebar debug widgets are only created when APP_ENV=dev
+DEBUG_MODE = os.getenv("APP_ENV", "").lower() == "dev"
+
+# Upper bound on concurrent Box API metadata writes in apply_metadata_direct_batch
+MAX_APPLY_WORKERS = 8
+
+# Seconds an applied payload is remembered in the session's applied_metadata_cache, so
+# re-clicking Apply with unchanged results skips the Box write
+APPLIED_METADATA_TTL = 300
+
+# Streamlit >= 1.37 has st.fragment, 1.33-1.36 only st.experimental_fragment;
+# older versions just run the section as part of the full page.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
 # Cache for template schemas to avoid repeated API calls
 if 'template_schema_cache' not in st.session_state:
     st.session_state.template_schema_cache = {}
@@ -26,6 +47,19 @@ if 'template_schema_cache' not in st.session_state:
 class ConversionError(ValueError):
     pass
 
+# Sentinel returned by the internal converters on failure, so the per-field
+# loop in apply_metadata_to_file_direct doesn't pay for raise/except per field.
+_FAIL = object()
+
+# Shared read-only default for missing lookups, instead of a fresh {} per call
+_EMPTY_DICT = MappingProxyType({})
+
+# Box API date format (UTC) used when converting 'date' fields
+_BOX_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Wrapper keys of a Box AI response that are never template fields
+_AI_RESPONSE_WRAPPER_KEYS = ('ai_agent_info', 'created_at', 'completion_reason', 'answer')
+
 def get_template_schema(client, full_scope, template_key):
     """
     Fetches the metadata template schema from Box API (compatible with SDK v3.x).
@@ -71,80 +105,92 @@ def get_template_schema(client, full_scope, template_key):
         st.session_state.template_schema_cache[cache_key] = None
         return None
 
-def convert_value_for_template(key, value, field_type):
+def _convert_float(key, value, original_value_repr):
+    if isinstance(value, str):
+        cleaned_value = value.replace('$', '').replace(',', '')
+        try:
+            return float(cleaned_value), None
+        except ValueError:
+            return _FAIL, f"Could not convert string '{value}' to float for key '{key}'."
+    elif isinstance(value, (int, float)):
+        return float(value), None
+    return _FAIL, f"Value {original_value_repr} for key '{key}' is not a string or number, cannot convert to float."
+
+def _convert_date(key, value, original_value_repr):
+    if not isinstance(value, str):
+        return _FAIL, f"Value {original_value_repr} for key '{key}' is not a string, cannot convert to date."
+    try:
+        dt = parser.parse(value)
+    except (parser.ParserError, ValueError) as e:
+        return _FAIL, f"Could not parse date string '{value}' for key '{key}': {e}."
+    # Ensure timezone-aware UTC for Box API format
+    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    else:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime(_BOX_DATE_FORMAT), None
+
+def _convert_string(key, value, original_value_repr):
+    # Box expects strings for enum types as well
+    if not isinstance(value, str):
+        logger.info(f"Converting value {original_value_repr} to string for key '{key}'.")
+    return str(value), None
+
+def _convert_multiselect(key, value, original_value_repr):
+    # Box expects a list of strings for multiSelect
+    if isinstance(value, list):
+        converted_list = [str(item) for item in value]
+        if converted_list != value:
+             logger.info(f"Converting items in list {original_value_repr} to string for key '{key}' (type multiSelect).")
+        return converted_list, None
+    elif isinstance(value, str):
+        # If a single string is provided, wrap it in a list
+        logger.info(f"Converting string value {original_value_repr} to list of strings for key '{key}' (type multiSelect).")
+        return [value], None
+    # Convert other types to string and wrap in list
+    logger.info(f"Converting value {original_value_repr} to list of strings for key '{key}' (type multiSelect).")
+    return [str(value)], None
+
+_CONVERTERS = {
+    'float': _convert_float,
+    'date': _convert_date,
+    'string': _convert_string,
+    'enum': _convert_string,
+    'multiSelect': _convert_multiselect,
+}
+
+def _try_convert_value(key, value, field_type):
     """
-    Converts a metadata value to the type specified by the template field.
-    Raises ConversionError if conversion fails. (Modified from original to be strict)
+    Non-raising variant of convert_value_for_template.
+    Returns (converted_value, None) on success or (_FAIL, error_message) on failure.
     """
-    # --- Use the strict version from the fix --- 
     if value is None:
         # Box API generally requires explicit nulls or removals for clearing fields,
         # but for applying new data, skipping None might be desired.
         # Let's return None and let the application logic decide.
-        return None 
-        
+        return None, None
+
+    converter = _CONVERTERS.get(field_type)
     original_value_repr = repr(value) # For logging
+    if converter is None:
+        logger.warning(f"Unknown field type '{field_type}' for key '{key}'. Cannot convert value {original_value_repr}.")
+        return _FAIL, f"Unknown field type '{field_type}' for key '{key}'."
 
     try:
-        if field_type == 'float':
-            if isinstance(value, str):
-                cleaned_value = value.replace('$', '').replace(',', '')
-                try:
-                    return float(cleaned_value)
-                except ValueError:
-                    raise ConversionError(f"Could not convert string '{value}' to float for key '{key}'.")
-            elif isinstance(value, (int, float)):
-                return float(value)
-            else:
-                 raise ConversionError(f"Value {original_value_repr} for key '{key}' is not a string or number, cannot convert to float.")
-                 
-        elif field_type == 'date':
-            if isinstance(value, str):
-                try:
-                    dt = parser.parse(value)
-                    # Ensure timezone-aware UTC for Box API format
-                    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    else:
-                        dt = dt.astimezone(timezone.utc)
-                    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-                except (parser.ParserError, ValueError) as e:
-                    raise ConversionError(f"Could not parse date string '{value}' for key '{key}': {e}.")
-            else:
-                raise ConversionError(f"Value {original_value_repr} for key '{key}' is not a string, cannot convert to date.")
-                
-        elif field_type == 'string' or field_type == 'enum':
-            # Box expects strings for enum types as well
-            if not isinstance(value, str):
-                logger.info(f"Converting value {original_value_repr} to string for key '{key}' (type {field_type}).")
-            return str(value)
-            
-        elif field_type == 'multiSelect':
-            # Box expects a list of strings for multiSelect
-            if isinstance(value, list):
-                converted_list = [str(item) for item in value]
-                if converted_list != value:
-                     logger.info(f"Converting items in list {original_value_repr} to string for key '{key}' (type multiSelect).")
-                return converted_list
-            elif isinstance(value, str):
-                # If a single string is provided, wrap it in a list
-                logger.info(f"Converting string value {original_value_repr} to list of strings for key '{key}' (type multiSelect).")
-                return [value]
-            else:
-                # Convert other types to string and wrap in list
-                logger.info(f"Converting value {original_value_repr} to list of strings for key '{key}' (type multiSelect).")
-                return [str(value)]
-                
-        else:
-            # Handle unknown types if necessary, or raise error
-            logger.warning(f"Unknown field type '{field_type}' for key '{key}'. Cannot convert value {original_value_repr}.")
-            raise ConversionError(f"Unknown field type '{field_type}' for key '{key}'.")
-            
-    except ConversionError: # Re-raise specific error
-        raise
+        return converter(key, value, original_value_repr)
     except Exception as e: # Catch unexpected errors during conversion
         logger.error(f"Unexpected error converting value {original_value_repr} for key '{key}' (type {field_type}): {e}.")
-        raise ConversionError(f"Unexpected error converting value for key '{key}': {e}")
+        return _FAIL, f"Unexpected error converting value for key '{key}': {e}"
+
+def convert_value_for_template(key, value, field_type):
+    """
+    Converts a metadata value to the type specified by the template field.
+    Raises ConversionError if conversion fails. (Modified from original to be strict)
+    """
+    converted_value, error = _try_convert_value(key, value, field_type)
+    if converted_value is _FAIL:
+        raise ConversionError(error)
+    return converted_value
 
 def fix_metadata_format(metadata_values):
     """
@@ -158,7 +204,7 @@ def fix_metadata_format(metadata_values):
             try:
                 # Attempt to make it JSON compatible (simple quote replacement)
                 json_compatible_str = value.replace("'", '"')
-                parsed_value = json.loads(json_compatible_str)
+                parsed_value = json_loads(json_compatible_str)
                 formatted_metadata[key] = parsed_value
             except json.JSONDecodeError:
                 # If parsing fails, keep the original string
@@ -183,8 +229,7 @@ def flatten_metadata_for_template(metadata_values):
         flattened_metadata = metadata_values.copy()
         
     # Remove common AI response wrapper keys if they exist at the top level
-    keys_to_remove = ['ai_agent_info', 'created_at', 'completion_reason', 'answer']
-    for key in keys_to_remove:
+    for key in _AI_RESPONSE_WRAPPER_KEYS:
         if key in flattened_metadata:
             del flattened_metadata[key]
     return flattened_metadata
@@ -234,11 +279,173 @@ def parse_template_id(template_id_full):
     logger.debug(f"Parsed template ID '{template_id_full}' -> full_scope='{full_scope}', template_key='{template_key}'")
     return full_scope, template_key
 
+def _prepare_metadata_payload(client, file_id, file_name, metadata_values, full_scope, template_key):
+    """
+    Filters and converts extracted metadata against the template schema.
+    Runs on the Streamlit script thread (uses session state and st.* messages).
+
+    Returns:
+        tuple: (metadata_to_apply, conversion_errors, result) where result is a
+               (success_flag, message_string) tuple if there is nothing to write,
+               otherwise None.
+    """
+    # 1. Confidence fields are never applied. Rather than copying every extracted
+    #    value into a filtered dict, only the keys the template asks for are read below.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"File ID {file_id}: Filtered metadata (no confidence): {filter_confidence_fields(metadata_values)}")
+
+    # 2. Get template schema (using the correctly parsed full_scope/template_key)
+    template_schema = get_template_schema(client, full_scope, template_key)
+    if template_schema is None:
+        error_msg = f"Could not retrieve template schema for {full_scope}/{template_key}. Cannot apply metadata to file {file_id} ({file_name})."
+        st.error(f"Schema retrieval failed for template '{template_key}'. Cannot apply metadata to {file_name}. Check template key and permissions.")
+        return None, [], (False, error_msg)
+    if not template_schema: # Empty schema
+         logger.warning(f"Template schema for {full_scope}/{template_key} is empty. No fields to apply for file {file_id} ({file_name}).")
+         st.info(f"Template '{template_key}' has no fields. Nothing to apply to {file_name}.")
+         return None, [], (True, "Template schema is empty, nothing to apply.")
+
+    # 3. Prepare metadata payload based on schema
+    metadata_to_apply = {}
+    conversion_errors = []
+    
+    for key, field_type in template_schema.items():
+        if key in metadata_values and not key.endswith("_confidence"):
+            value = metadata_values[key]
+            converted_value, error = _try_convert_value(key, value, field_type)
+            if converted_value is _FAIL:
+                error_msg = f"Conversion error for key '{key}' (expected type '{field_type}', value: {repr(value)}): {error}. Field skipped."
+                logger.warning(error_msg)
+                conversion_errors.append(error_msg)
+                continue
+            # Only add non-None values to the payload
+            if converted_value is not None:
+                metadata_to_apply[key] = converted_value
+            else:
+                logger.info(f"Value for key '{key}' is None after conversion. Skipping for file {file_id}.")
+        else:
+            logger.info(f"Template field '{key}' not found in extracted metadata for file {file_id}. Skipping field.")
+
+    # 4. Check if there's anything to apply
+    if not metadata_to_apply:
+        if conversion_errors:
+            warn_msg = f"Metadata application skipped for file {file_name}: No fields could be successfully converted. Errors: {'; '.join(conversion_errors)}"
+            st.warning(warn_msg)
+            logger.warning(warn_msg)
+            return None, conversion_errors, (False, f"No valid metadata fields to apply after conversion errors: {'; '.join(conversion_errors)}")
+        else:
+            info_msg = f"No matching metadata fields found or all values were None for file {file_name}. Nothing to apply."
+            st.info(info_msg)
+            logger.info(info_msg)
+            return None, conversion_errors, (True, "No matching fields to apply")
+
+    return metadata_to_apply, conversion_errors, None
+
+def _write_metadata_instance(client, file_id, file_name, full_scope, template_key, metadata_to_apply):
+    """
+    Creates or updates the metadata instance on a file via the Box API.
+    Makes no Streamlit calls, so it is safe to run from worker threads.
+
+    Returns:
+        tuple: (success_flag, message_string)
+    """
+    # 5. Apply metadata via Box API using the correct update pattern
+    logger.info(f"Attempting to apply metadata to file {file_id} using operations: {metadata_to_apply}")
+    is_update = False
+    try:
+        # Get the metadata instance object
+        metadata_instance = client.file(file_id).metadata(scope=full_scope, template=template_key)
+        
+        # Check if instance exists (needed for create vs update logic)
+        try:
+            existing_data = metadata_instance.get() # Try to get existing data
+            is_update = True
+            logger.info(f"Metadata instance exists for {full_scope}/{template_key} on file {file_id}. Performing update.")
+        except exception.BoxAPIException as e:
+            if e.status == 404:
+                is_update = False
+                logger.info(f"Metadata instance does not exist for {full_scope}/{template_key} on file {file_id}. Performing create.")
+            else:
+                raise # Re-raise other API errors during get
+
+        if is_update:
+            # --- Use Update Pattern --- 
+            ops = metadata_instance.start_update() # Get MetadataUpdate object
+            for key, value in metadata_to_apply.items():
+                # Use 'replace' operation for simplicity (adds if not present, replaces if present)
+                # Other ops: 'add', 'test', 'remove'
+                ops.replace(f"/{key}", value)
+            
+            updated_metadata = metadata_instance.update(ops) # Apply the operations
+            success_msg = f"Metadata updated successfully for {file_name}."
+        else:
+            # --- Use Create --- 
+            # The create method still accepts a dictionary directly
+            created_metadata = metadata_instance.create(metadata_to_apply)
+            success_msg = f"Metadata created successfully for {file_name}."
+        logger.info(success_msg)
+        return True, success_msg
+             
+    except exception.BoxAPIException as e:
+        # Catch errors during the update or create call specifically
+        error_context = "updating" if is_update else "creating"
+        error_msg = f"Box API Error {error_context} metadata for {file_name}: Status={e.status}, Code={e.code}, Message={e.message}"
+        logger.error(error_msg, exc_info=True) # Log traceback for API errors
+        return False, error_msg
+    except Exception as e:
+        # Catch-all for unexpected errors during the write for this file
+        error_msg = f"Unexpected error applying metadata to file {file_id} ({file_name}): {e}"
+        logger.exception(error_msg) # Log full traceback
+        return False, error_msg
+
+def _report_write_result(success, message, conversion_errors):
+    """
+    Shows the outcome of _write_metadata_instance and folds in conversion warnings.
+
+    Returns:
+        tuple: (success_flag, message_string)
+    """
+    if success:
+        if conversion_errors:
+             st.success(f"{message} Warnings during conversion: {'; '.join(conversion_errors)}")
+             return True, f"{message} Conversion warnings: {'; '.join(conversion_errors)}"
+        st.success(message)
+        return True, message
+    st.error(message)
+    return False, f"{message}. Conversion warnings: {'; '.join(conversion_errors)}" if conversion_errors else message
+
+def _prepare_or_fail(client, job):
+    """
+    Runs _prepare_metadata_payload for an ApplyJob, converting unexpected errors
+    into a failed result the same way apply_metadata_to_file_direct does.
+    """
+    logger.info(f"Starting metadata application for file ID {job.file_id} ({job.file_name}) with template {job.full_scope}/{job.template_key}")
+    try:
+        return _prepare_metadata_payload(
+            client, job.file_id, job.file_name, job.metadata_values, job.full_scope, job.template_key
+        )
+    except Exception as e:
+        # Catch-all for unexpected errors during the process for this file
+        error_msg = f"Unexpected error applying metadata to file {job.file_id} ({job.file_name}): {e}"
+        logger.exception(error_msg) # Log full traceback
+        st.error(error_msg)
+        return None, [], (False, error_msg)
+
+@dataclass
+class ApplyJob:
+    """A single file/template pair to apply metadata to."""
+    # Explicit __slots__ (no per-instance __dict__); dataclass(slots=True) needs Python 3.10
+    __slots__ = ('file_id', 'file_name', 'metadata_values', 'full_scope', 'template_key')
+    file_id: str
+    file_name: str
+    metadata_values: dict
+    full_scope: str
+    template_key: str
+
 def apply_metadata_to_file_direct(client, file_id, file_name, metadata_values, full_scope, template_key):
     """
     Applies metadata to a single file using the correct SDK update pattern.
     Uses FULL scope and simple template key.
-    (Internal function called by apply_metadata_direct)
     
     Args:
         client: Box client object
@@ -251,120 +458,239 @@ def apply_metadata_to_file_direct(client, file_id, file_name, metadata_values, f
     Returns:
         tuple: (success_flag, message_string)
     """
-    logger.info(f"Starting metadata application for file ID {file_id} ({file_name}) with template {full_scope}/{template_key}")
+    job = ApplyJob(file_id, file_name, metadata_values, full_scope, template_key)
+    metadata_to_apply, conversion_errors, result = _prepare_or_fail(client, job)
+    if result is not None:
+        return result
+    success, message = _write_metadata_instance(client, file_id, file_name, full_scope, template_key, metadata_to_apply)
+    return _report_write_result(success, message, conversion_errors)
+
+def _payload_cache_key(job, metadata_to_apply):
+    """
+    Key for applied_metadata_cache: (file_id, scope, template_key, payload digest).
+    """
+    payload_json = json.dumps(metadata_to_apply, sort_keys=True, default=str)
+    payload_hash = hashlib.blake2b(payload_json.encode("utf-8"), digest_size=16).digest()
+    return (job.file_id, job.full_scope, job.template_key, payload_hash)
+
+def _was_recently_applied(applied_metadata_cache, cache_key):
+    """
+    Returns True if an identical payload was applied within APPLIED_METADATA_TTL seconds.
+    """
+    applied_at = applied_metadata_cache.get(cache_key)
+    if applied_at is None:
+        return False
+    if time.time() - applied_at > APPLIED_METADATA_TTL:
+        del applied_metadata_cache[cache_key]
+        return False
+    return True
+
+def apply_metadata_direct_batch(client, jobs, max_workers=MAX_APPLY_WORKERS, on_result=None):
+    """
+    Applies metadata for many files, issuing the Box API writes concurrently.
+    Schema lookup, conversion and all Streamlit output stay on the script thread;
+    only _write_metadata_instance runs in the worker pool. A payload identical to
+    one applied to the same file/template within APPLIED_METADATA_TTL seconds is
+    not written again.
     
-    try:
-        # 1. Pre-process metadata: Filter confidence fields
-        filtered_metadata = filter_confidence_fields(metadata_values) 
-        logger.debug(f"File ID {file_id}: Filtered metadata (no confidence): {filtered_metadata}")
-
-        # 2. Get template schema (using the correctly parsed full_scope/template_key)
-        template_schema = get_template_schema(client, full_scope, template_key)
-        if template_schema is None:
-            error_msg = f"Could not retrieve template schema for {full_scope}/{template_key}. Cannot apply metadata to file {file_id} ({file_name})."
-            st.error(f"Schema retrieval failed for template '{template_key}'. Cannot apply metadata to {file_name}. Check template key and permissions.")
-            return False, error_msg
-        if not template_schema: # Empty schema
-             logger.warning(f"Template schema for {full_scope}/{template_key} is empty. No fields to apply for file {file_id} ({file_name}).")
-             st.info(f"Template '{template_key}' has no fields. Nothing to apply to {file_name}.")
-             return True, "Template schema is empty, nothing to apply."
-
-        # 3. Prepare metadata payload based on schema
-        metadata_to_apply = {}
-        conversion_errors = []
+    Args:
+        client: Box client object
+        jobs (list): ApplyJob instances.
+        max_workers (int): Maximum number of concurrent Box API writes.
+        on_result (callable): Optional callback(job, (success_flag, message_string))
+            invoked on the script thread as each job finishes.
         
-        for key, field_type in template_schema.items():
-            if key in filtered_metadata:
-                value = filtered_metadata[key]
-                try:
-                    converted_value = convert_value_for_template(key, value, field_type)
-                    # Only add non-None values to the payload
-                    if converted_value is not None:
-                        metadata_to_apply[key] = converted_value
-                    else:
-                        logger.info(f"Value for key '{key}' is None after conversion. Skipping for file {file_id}.")
-                except ConversionError as e:
-                    error_msg = f"Conversion error for key '{key}' (expected type '{field_type}', value: {repr(value)}): {e}. Field skipped."
-                    logger.warning(error_msg)
-                    conversion_errors.append(error_msg)
-                except Exception as e:
-                    error_msg = f"Unexpected error processing key '{key}' for file {file_id}: {e}. Field skipped."
-                    logger.error(error_msg)
-                    conversion_errors.append(error_msg)
-            else:
-                logger.info(f"Template field '{key}' not found in extracted metadata for file {file_id}. Skipping field.")
-
-        # 4. Check if there's anything to apply
-        if not metadata_to_apply:
-            if conversion_errors:
-                warn_msg = f"Metadata application skipped for file {file_name}: No fields could be successfully converted. Errors: {'; '.join(conversion_errors)}"
-                st.warning(warn_msg)
-                logger.warning(warn_msg)
-                return False, f"No valid metadata fields to apply after conversion errors: {'; '.join(conversion_errors)}"
-            else:
-                info_msg = f"No matching metadata fields found or all values were None for file {file_name}. Nothing to apply."
-                st.info(info_msg)
-                logger.info(info_msg)
-                return True, "No matching fields to apply"
+    Returns:
+        list: (success_flag, message_string) per job, in the same order as jobs.
+    """
+    # Per browser session, so it is created here rather than at import
+    applied_metadata_cache = st.session_state.setdefault("applied_metadata_cache", {})
+    results = [None] * len(jobs)
+    pending = []
 
-        # 5. Apply metadata via Box API using the correct update pattern
-        logger.info(f"Attempting to apply metadata to file {file_id} using operations: {metadata_to_apply}")
-        try:
-            # Get the metadata instance object
-            metadata_instance = client.file(file_id).metadata(scope=full_scope, template=template_key)
+    def _finish(index, result):
+        results[index] = result
+        if on_result:
+            on_result(jobs[index], result)
+
+    for index, job in enumerate(jobs):
+        metadata_to_apply, conversion_errors, result = _prepare_or_fail(client, job)
+        if result is not None:
+            _finish(index, result)
+            continue
+
+        cache_key = _payload_cache_key(job, metadata_to_apply)
+        if _was_recently_applied(applied_metadata_cache, cache_key):
+            logger.info(f"Identical metadata already applied to file {job.file_id} within {APPLIED_METADATA_TTL}s. Skipping Box API write.")
+            skip_msg = f"Metadata write skipped for {job.file_name}: the same metadata was already applied in the last {APPLIED_METADATA_TTL // 60} minutes."
+            _finish(index, _report_write_result(True, skip_msg, conversion_errors))
+            continue
+
+        pending.append((index, metadata_to_apply, conversion_errors, cache_key))
+
+    if not pending:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+        future_to_index = {}
+        for index, metadata_to_apply, conversion_errors, cache_key in pending:
+            job = jobs[index]
+            future = executor.submit(
+                _write_metadata_instance,
+                client, job.file_id, job.file_name, job.full_scope, job.template_key, metadata_to_apply
+            )
+            future_to_index[future] = (index, conversion_errors, cache_key)
+
+        for future in concurrent.futures.as_completed(future_to_index):
+            index, conversion_errors, cache_key = future_to_index[future]
+            success, message = future.result()
+            if success:
+                applied_metadata_cache[cache_key] = time.time()
+            _finish(index, _report_write_result(success, message, conversion_errors))
+
+    return results
+
+def get_verified_user_name(client):
+    """
+    Returns the name of the user the client is authenticated as.
+    The result is kept in session state against the client object itself and
+    compared by identity, so the Box user lookup is not repeated on every rerun
+    and the client is never hashed.
+    """
+    cached = st.session_state.get("verified_client_user")
+    if cached and cached[0] is client:
+        return cached[1]
+    user = client.user().get()
+    logger.info(f"Verified client authentication as {user.name}")
+    st.session_state.verified_client_user = (client, user.name)
+    return user.name
+
+@_fragment
+def _apply_metadata_section(client, results_map, categorization_results=None, doc_type_to_template_map=None,
+                            default_full_scope=None, default_template_key=None):
+    """
+    The Apply button and its progress/summary output. Runs as a fragment so
+    clicking the button reruns only this section, not the whole page.
+    None for the categorization/mapping arguments means "no information".
+    """
+    if categorization_results is None:
+        categorization_results = _EMPTY_DICT
+    if doc_type_to_template_map is None:
+        doc_type_to_template_map = _EMPTY_DICT
+    has_default_template = bool(default_template_key)
+    has_categorization_info = bool(categorization_results)
+    has_mapping_info = bool(doc_type_to_template_map)
+
+    # --- Keep original button and loop structure --- 
+    if st.button("Apply Extracted Metadata to Files", key="apply_metadata_button"):
+        # Only needed when applying, so don't rebuild it on every page rerun
+        file_id_to_file_name = {str(f["id"]): f["name"] for f in st.session_state.get("selected_files", []) if isinstance(f, dict) and "id" in f}
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        success_count = 0
+        error_count = 0
+        skipped_count = 0 # Count files skipped due to no template
+        total_files = len(results_map)
+        all_conversion_warnings = {} # Store warnings per file_id
+
+        jobs = []
+        done_count = 0
+        # Bind the per-file lookups once rather than resolving the methods every iteration
+        get_file_name = file_id_to_file_name.get
+        get_categorization = categorization_results.get
+        get_mapped_template = doc_type_to_template_map.get
+        add_job = jobs.append
+        for i, (file_id, metadata_values) in enumerate(results_map.items()):
+            file_name = get_file_name(file_id, f"File ID {file_id}")
+            status_text.text(f"Resolving template for {file_name}... ({i+1}/{total_files})")
             
-            # Check if instance exists (needed for create vs update logic)
-            try:
-                existing_data = metadata_instance.get() # Try to get existing data
-                is_update = True
-                logger.info(f"Metadata instance exists for {full_scope}/{template_key} on file {file_id}. Performing update.")
-            except exception.BoxAPIException as e:
-                if e.status == 404:
-                    is_update = False
-                    logger.info(f"Metadata instance does not exist for {full_scope}/{template_key} on file {file_id}. Performing create.")
+            if not isinstance(metadata_values, dict):
+                 logger.error(f"Metadata for file {file_id} is not a dictionary: {type(metadata_values)}. Skipping.")
+                 st.error(f"Invalid metadata format for {file_name}. Skipping.")
+                 error_count += 1
+                 done_count += 1
+                 progress_bar.progress(done_count / total_files)
+                 continue
+                 
+            # --- Determine Template for THIS file using CORRECTED parsing --- 
+            file_full_scope = None
+            file_template_key = None
+            template_source = "Default"
+            
+            # 1. Check categorization results for this file_id
+            file_categorization = get_categorization(file_id) if has_categorization_info else None
+            if file_categorization is not None:
+                doc_type = file_categorization.get("document_type")
+                if doc_type and has_mapping_info and doc_type in doc_type_to_template_map:
+                    mapped_template_id = get_mapped_template(doc_type)
+                    if mapped_template_id:
+                        try:
+                            # Use the corrected parsing function
+                            file_full_scope, file_template_key = parse_template_id(mapped_template_id)
+                            template_source = f"Mapping for '{doc_type}'"
+                            logger.info(f"Using mapped template for file {file_id} ({doc_type}): {file_full_scope}/{file_template_key}")
+                        except ValueError as e:
+                            logger.warning(f"Invalid template ID '{mapped_template_id}' mapped for doc type '{doc_type}'. Falling back to default. Error: {e}")
+                    else:
+                        logger.info(f"No template mapped for doc type '{doc_type}'. Falling back to default.")
                 else:
-                    raise # Re-raise other API errors during get
-
-            if is_update:
-                # --- Use Update Pattern --- 
-                ops = metadata_instance.start_update() # Get MetadataUpdate object
-                for key, value in metadata_to_apply.items():
-                    # Use 'replace' operation for simplicity (adds if not present, replaces if present)
-                    # Other ops: 'add', 'test', 'remove'
-                    ops.replace(f"/{key}", value)
-                
-                updated_metadata = metadata_instance.update(ops) # Apply the operations
-                success_msg = f"Metadata updated successfully for {file_name}."
-                logger.info(success_msg)
+                     logger.info(f"No document type found or no mapping exists for file {file_id}. Falling back to default.")
             else:
-                # --- Use Create --- 
-                # The create method still accepts a dictionary directly
-                created_metadata = metadata_instance.create(metadata_to_apply)
-                success_msg = f"Metadata created successfully for {file_name}."
-                logger.info(success_msg)
-
-            # Report success (common path for create/update)
-            if conversion_errors:
-                 st.success(f"{success_msg} Warnings during conversion: {'; '.join(conversion_errors)}")
-                 return True, f"{success_msg} Conversion warnings: {'; '.join(conversion_errors)}"
+                 logger.info(f"No categorization result found for file {file_id}. Falling back to default.")
+
+            # 2. Fallback to default if no specific template was found/valid
+            if not file_template_key:
+                if has_default_template:
+                    file_full_scope = default_full_scope
+                    file_template_key = default_template_key
+                    template_source = "Default"
+                    logger.info(f"Using default template for file {file_id}: {file_full_scope}/{file_template_key}")
+                else:
+                    # No specific mapping AND no valid default template
+                    logger.warning(f"No specific template mapping and no valid default template configured. Skipping metadata application for file {file_id} ({file_name}).")
+                    st.warning(f"Skipping {file_name}: No applicable metadata template found.")
+                    skipped_count += 1
+                    done_count += 1
+                    progress_bar.progress(done_count / total_files) # Update progress even if skipped
+                    continue # Skip to the next file
+            
+            logger.info(f"Queued {file_name} for template '{file_template_key}' ({template_source})")
+            add_job(ApplyJob(file_id, file_name, metadata_values, file_full_scope, file_template_key))
+
+        def _on_result(job, result):
+            nonlocal success_count, error_count, done_count
+            success, message = result
+            if success:
+                success_count += 1
+                # Store conversion warnings if message contains them 
+                if "Conversion warnings:" in message:
+                    # Extract the warning part for summary
+                    warning_detail = message.split("Conversion warnings:")[1].strip()
+                    if warning_detail:
+                        all_conversion_warnings[job.file_id] = warning_detail
             else:
-                 st.success(success_msg)
-                 return True, success_msg
-                 
-        except exception.BoxAPIException as e:
-            # Catch errors during the update or create call specifically
-            error_context = "updating" if is_update else "creating"
-            error_msg = f"Box API Error {error_context} metadata for {file_name}: Status={e.status}, Code={e.code}, Message={e.message}"
-            logger.error(error_msg, exc_info=True) # Log traceback for API errors
-            st.error(error_msg)
-            return False, f"{error_msg}. Conversion warnings: {'; '.join(conversion_errors)}" if conversion_errors else error_msg
-                
-    except Exception as e:
-        # Catch-all for unexpected errors during the process for this file
-        error_msg = f"Unexpected error applying metadata to file {file_id} ({file_name}): {e}"
-        logger.exception(error_msg) # Log full traceback
-        st.error(error_msg)
-        return False, error_msg
+                error_count += 1
+                # Error already logged/shown by apply_metadata_direct_batch
+            done_count += 1
+            status_text.text(f"Applied metadata to {job.file_name}... ({done_count}/{total_files})")
+            progress_bar.progress(done_count / total_files)
+
+        # --- Apply all resolved files; Box API writes run concurrently --- 
+        apply_metadata_direct_batch(client, jobs, on_result=_on_result)
+
+        # Final status update (original logic, slightly enhanced for warnings/skipped)
+        status_text.text("Metadata application process complete.")
+        st.write("---")
+        st.write(f"**Summary:**")
+        st.write(f"- Successfully applied/updated metadata for {success_count} files.")
+        if all_conversion_warnings:
+             st.write(f"- Conversion warnings occurred for {len(all_conversion_warnings)} files (some fields may have been skipped). Check logs or messages above for details.")
+        if skipped_count > 0:
+             st.write(f"- Skipped applying metadata for {skipped_count} files due to no applicable template.")
+        if error_count > 0:
+            st.write(f"- Failed to apply metadata or encountered errors for {error_count} files (see errors/warnings above)." )
+        elif skipped_count == 0 and not all_conversion_warnings:
+             st.write(f"- No application errors or conversion warnings encountered.")
 
 def apply_metadata_direct():
     """
@@ -374,7 +700,7 @@ def apply_metadata_direct():
     st.title("Apply Metadata")
     
     # --- Keep original debug checkbox and client checks --- 
-    debug_mode = st.sidebar.checkbox("Debug Session State", key="debug_checkbox")
+    debug_mode = DEBUG_MODE and st.sidebar.checkbox("Debug Session State", key="debug_checkbox")
     if debug_mode:
         # ... (debug code remains the same)
         st.sidebar.write("### Session State Debug")
@@ -420,9 +746,8 @@ def apply_metadata_direct():
     client = st.session_state.client
     
     try:
-        user = client.user().get()
-        logger.info(f"Verified client authentication as {user.name}")
-        st.success(f"Authenticated as {user.name}")
+        user_name = get_verified_user_name(client)
+        st.success(f"Authenticated as {user_name}")
     except Exception as e:
         logger.error(f"Error verifying client: {str(e)}")
         st.error(f"Authentication error: {str(e)}. Please re-authenticate.")
@@ -441,8 +766,7 @@ def apply_metadata_direct():
     processing_state = st.session_state.processing_state
     logger.info(f"Processing state keys: {list(processing_state.keys())}")
     
-    results_map = processing_state.get("results", {})
-    file_id_to_file_name = {str(f["id"]): f["name"] for f in st.session_state.get("selected_files", []) if isinstance(f, dict) and "id" in f}
+    results_map = processing_state.get("results", _EMPTY_DICT)
     
     # --- Determine Default Template (used if no mapping found) --- 
     default_template_id_full = None
@@ -469,8 +793,8 @@ def apply_metadata_direct():
         return
 
     # --- Get Categorization and Mapping Info --- 
-    categorization_results = st.session_state.get("document_categorization", {}).get("results", {})
-    doc_type_to_template_map = st.session_state.get("document_type_to_template", {})
+    categorization_results = st.session_state.get("document_categorization", _EMPTY_DICT).get("results", _EMPTY_DICT)
+    doc_type_to_template_map = st.session_state.get("document_type_to_template", _EMPTY_DICT)
     has_categorization_info = bool(categorization_results)
     has_mapping_info = bool(doc_type_to_template_map)
 
@@ -481,110 +805,17 @@ def apply_metadata_direct():
 
     st.write(f"Found {len(results_map)} files with extraction results to process.")
 
-    # --- Keep original button and loop structure --- 
-    if st.button("Apply Extracted Metadata to Files", key="apply_metadata_button"):
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        success_count = 0
-        error_count = 0
-        skipped_count = 0 # Count files skipped due to no template
-        total_files = len(results_map)
-        all_conversion_warnings = {} # Store warnings per file_id
-
-        for i, (file_id, metadata_values) in enumerate(results_map.items()):
-            file_name = file_id_to_file_name.get(file_id, f"File ID {file_id}")
-            status_text.text(f"Processing {file_name}... ({i+1}/{total_files})")
-            
-            if not isinstance(metadata_values, dict):
-                 logger.error(f"Metadata for file {file_id} is not a dictionary: {type(metadata_values)}. Skipping.")
-                 st.error(f"Invalid metadata format for {file_name}. Skipping.")
-                 error_count += 1
-                 continue
-                 
-            # --- Determine Template for THIS file using CORRECTED parsing --- 
-            file_full_scope = None
-            file_template_key = None
-            template_source = "Default"
-            
-            # 1. Check categorization results for this file_id
-            if has_categorization_info and file_id in categorization_results:
-                doc_type = categorization_results[file_id].get("document_type")
-                if doc_type and has_mapping_info and doc_type in doc_type_to_template_map:
-                    mapped_template_id = doc_type_to_template_map[doc_type]
-                    if mapped_template_id:
-                        try:
-                            # Use the corrected parsing function
-                            file_full_scope, file_template_key = parse_template_id(mapped_template_id)
-                            template_source = f"Mapping for '{doc_type}'"
-                            logger.info(f"Using mapped template for file {file_id} ({doc_type}): {file_full_scope}/{file_template_key}")
-                        except ValueError as e:
-                            logger.warning(f"Invalid template ID '{mapped_template_id}' mapped for doc type '{doc_type}'. Falling back to default. Error: {e}")
-                    else:
-                        logger.info(f"No template mapped for doc type '{doc_type}'. Falling back to default.")
-                else:
-                     logger.info(f"No document type found or no mapping exists for file {file_id}. Falling back to default.")
-            else:
-                 logger.info(f"No categorization result found for file {file_id}. Falling back to default.")
-
-            # 2. Fallback to default if no specific template was found/valid
-            if not file_template_key:
-                if has_default_template:
-                    file_full_scope = default_full_scope
-                    file_template_key = default_template_key
-                    template_source = "Default"
-                    logger.info(f"Using default template for file {file_id}: {file_full_scope}/{file_template_key}")
-                else:
-                    # No specific mapping AND no valid default template
-                    logger.warning(f"No specific template mapping and no valid default template configured. Skipping metadata application for file {file_id} ({file_name}).")
-                    st.warning(f"Skipping {file_name}: No applicable metadata template found.")
-                    skipped_count += 1
-                    progress_bar.progress((i + 1) / total_files) # Update progress even if skipped
-                    continue # Skip to the next file
-            
-            # Display which template is being used
-            status_text.text(f"Applying metadata to {file_name} using template '{file_template_key}' ({template_source})... ({i+1}/{total_files})")
-
-            # --- Call internal function with the determined full_scope/template_key --- 
-            success, message = apply_metadata_to_file_direct(
-                client,
-                file_id,
-                file_name,
-                metadata_values, 
-                file_full_scope,    # Pass the specific full_scope for this file
-                file_template_key   # Pass the specific template_key for this file
-            )
-            
-            if success:
-                success_count += 1
-                # Store conversion warnings if message contains them 
-                if "Conversion warnings:" in message:
-                    # Extract the warning part for summary
-                    warning_detail = message.split("Conversion warnings:")[1].strip()
-                    if warning_detail:
-                        all_conversion_warnings[file_id] = warning_detail
-            else:
-                error_count += 1
-                # Error already logged/shown by apply_metadata_to_file_direct
-            
-            # Update progress bar (original logic)
-            progress_bar.progress((i + 1) / total_files)
-
-        # Final status update (original logic, slightly enhanced for warnings/skipped)
-        status_text.text("Metadata application process complete.")
-        st.write("---")
-        st.write(f"**Summary:**")
-        st.write(f"- Successfully applied/updated metadata for {success_count} files.")
-        if all_conversion_warnings:
-             st.write(f"- Conversion warnings occurred for {len(all_conversion_warnings)} files (some fields may have been skipped). Check logs or messages above for details.")
-        if skipped_count > 0:
-             st.write(f"- Skipped applying metadata for {skipped_count} files due to no applicable template.")
-        if error_count > 0:
-            st.write(f"- Failed to apply metadata or encountered errors for {error_count} files (see errors/warnings above)." )
-        elif skipped_count == 0 and not all_conversion_warnings:
-             st.write(f"- No application errors or conversion warnings encountered.")
+    _apply_metadata_section(
+        client,
+        results_map,
+        categorization_results,
+        doc_type_to_template_map,
+        default_full_scope,
+        default_template_key,
+    )
 
     # --- Keep original debug payload display --- 
-    if st.sidebar.checkbox("Show Processed Metadata Payload (Debug)", key="debug_payload_checkbox"):
+    if DEBUG_MODE and st.sidebar.checkbox("Show Processed Metadata Payload (Debug)", key="debug_payload_checkbox"):
         # ... (debug code remains the same)
         st.sidebar.write("### Processed Metadata (Example First File)")
         if results_map:
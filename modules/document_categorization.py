@@ -4,16 +4,91 @@ import json
 import requests
 import re
 import os
+import copy
 import datetime
-import pandas as pd
-import altair as alt
-from typing import Dict, Any, List, Optional, Tuple
+import time
+import concurrent.futures
+import bisect
+import hashlib
+import functools
+import threading
+from collections import Counter
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Tuple
+from typing_extensions import TypedDict
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from modules.cache import PersistentCache
+from modules.box_ai import (
+    BOX_AI_TIMEOUT, TTLCache, box_ai_headers, caller_id, file_version_id, get_access_token, get_file_info,
+    http_session, json_dumps, json_loads
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Patterns for parsing Box AI categorization answers
+_CATEGORY_RE = re.compile(r"^Category:\s*(.*?)$", re.MULTILINE | re.IGNORECASE)
+_CONFIDENCE_RE = re.compile(r"^Confidence:\s*([0-9.]+)", re.MULTILINE | re.IGNORECASE)
+_REASONING_RE = re.compile(r"^Reasoning:\s*(.*)", re.MULTILINE | re.IGNORECASE | re.DOTALL)
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+
+# Upper bound on files categorized concurrently
+MAX_CATEGORIZATION_WORKERS = 16
+
+# Files per Box AI request when batched first-stage categorization is enabled (default
+# and upper limit of the setting); larger batches tend to lower per-file accuracy
+CATEGORIZATION_BATCH_SIZE = 8
+MAX_CATEGORIZATION_BATCH_SIZE = 16
+
+# Selections larger than this default to batched first-stage requests
+LARGE_SELECTION_THRESHOLD = 50
+
+# Minimum seconds between progress updates while categorizing
+PROGRESS_UPDATE_INTERVAL = 0.25
+
+# Seconds extract_document_features results are reused within a session
+DOCUMENT_FEATURES_TTL = 3600
+
+# Upper bound on Box AI requests in flight across all workers. Consensus runs start
+# one request per model inside each file worker, which would otherwise multiply
+# concurrency past what Box rate limits allow.
+BOX_AI_MAX_CONCURRENT_REQUESTS = 16
+_box_ai_slots = threading.BoundedSemaphore(BOX_AI_MAX_CONCURRENT_REQUESTS)
+
+def _post_box_ai(api_url: str, headers: Dict[str, str], request_body: Dict[str, Any]) -> requests.Response:
+    """
+    POST to Box AI on the shared HTTP session, waiting for a free request slot.
+    The body is encoded here (with orjson when available) rather than by requests.
+    """
+    body = json_dumps(request_body)
+    with _box_ai_slots:
+        return http_session.post(api_url, headers=headers, data=body, timeout=BOX_AI_TIMEOUT)
+
+# Categorization answers, kept in memory and on disk across sessions
+CATEGORIZATION_CACHE_TTL = 7 * 24 * 3600
+_categorization_cache = PersistentCache(
+    cache_dir=os.path.join(".cache", "categorization"),
+    memory_ttl=3600,
+    file_ttl=CATEGORIZATION_CACHE_TTL
+)
+
+# In-process LRU of answers keyed on (stage, caller, model, file, prompt). It is checked before
+# the persistent cache, whose key needs a file-version lookup; the short TTL bounds how
+# long a newly uploaded file version can be answered from here.
+CATEGORIZE_CACHE_TTL = 300
+CATEGORIZE_CACHE_MAX_ENTRIES = 1024
+_ask_cache = TTLCache(CATEGORIZE_CACHE_TTL, CATEGORIZE_CACHE_MAX_ENTRIES)
+
+# Finished per-file results, written as each file completes so a cancelled or
+# interrupted run can resume without redoing the files it already finished
+CATEGORIZATION_RESULTS_TTL = 24 * 3600
+_results_store = PersistentCache(
+    cache_dir=os.path.join(".cache", "categorization_results"),
+    memory_ttl=3600,
+    file_ttl=CATEGORIZATION_RESULTS_TTL
+)
+
 def document_categorization():
     """
     Enhanced document categorization with improved confidence metrics
@@ -39,6 +114,10 @@ def document_categorization():
             "errors": {}
         }
     
+    # Per-session cache of extract_document_features results: file_id -> (fetched_at, features)
+    if "document_features_cache" not in st.session_state:
+        st.session_state.document_features_cache = {}
+    
     # Initialize confidence thresholds if not exists
     if "confidence_thresholds" not in st.session_state:
         st.session_state.confidence_thresholds = {
@@ -109,6 +188,22 @@ def document_categorization():
                 value=False,
                 help="When enabled, multiple AI models will be used and their results combined for more accurate categorization"
             )
+            
+            # Batched first-stage option
+            use_batch_requests = st.checkbox(
+                "Batch files into combined requests",
+                value=num_files > LARGE_SELECTION_THRESHOLD,
+                help="When enabled, first-stage categorization sends several files per Box AI request. Not used with multi-model consensus."
+            )
+            batch_size = st.number_input(
+                "Files per batched request",
+                min_value=2,
+                max_value=MAX_CATEGORIZATION_BATCH_SIZE,
+                value=CATEGORIZATION_BATCH_SIZE,
+                step=1,
+                help="Smaller batches are usually more accurate; larger ones need fewer requests",
+                disabled=not use_batch_requests
+            )
         
         with col2:
             # Confidence threshold for second-stage
@@ -118,9 +213,12 @@ def document_categorization():
                 max_value=1.0,
                 value=0.6,
                 step=0.05,
-                help="Documents with confidence below this threshold will undergo second-stage analysis",
+                help="Documents with confidence below this threshold will undergo second-stage analysis. "
+                     "Documents that already reach the auto-accept threshold never do.",
                 disabled=not use_two_stage
             )
+            # A first-stage answer that would be auto-accepted gains nothing from a second LLM call
+            confidence_threshold = min(confidence_threshold, st.session_state.confidence_thresholds["auto_accept"])
             
             # Select models for consensus
             consensus_models = []
@@ -136,7 +234,7 @@ def document_categorization():
                     st.warning("Please select at least one model for consensus categorization")
         
         # Categorization controls
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         
         with col1:
             start_button = st.button("Start Categorization", key="start_categorization_button_cat", use_container_width=True)
@@ -144,112 +242,178 @@ def document_categorization():
         with col2:
             cancel_button = st.button("Cancel Categorization", key="cancel_categorization_button_cat", use_container_width=True)
         
+        with col3:
+            clear_button = st.button(
+                "Clear Saved Results",
+                key="clear_categorization_results_button_cat",
+                use_container_width=True,
+                help="Forget results saved by earlier runs with these files and settings, so Start categorizes every file again"
+            )
+        
+        if start_button or cancel_button or clear_button:
+            # Skip repeated selections of the same file so it isn't categorized (and billed) twice
+            seen_file_ids = set()
+            files = []
+            for file in st.session_state.selected_files:
+                if file["id"] not in seen_file_ids:
+                    seen_file_ids.add(file["id"])
+                    files.append(file)
+            if len(files) < len(st.session_state.selected_files):
+                logger.info(f"Removed {len(st.session_state.selected_files) - len(files)} duplicate file selections before categorization")
+            # Document types are fixed for this run, so build names and prompts once
+            document_type_names, category_options_text, categorization_prompt = get_category_options(
+                st.session_state.document_types
+            )
+            
+            # Workers can't read session state, so they get the client's token source as an
+            # argument and re-read the token for each file, picking up refreshed tokens
+            token_source = functools.partial(get_access_token, st.session_state.client)
+            try:
+                access_token = token_source()
+            except Exception as e:
+                st.error(f"Could not get a Box access token: {str(e)}. Please authenticate again.")
+                return
+            
+            # Look up each file's version and features once for the whole run
+            file_infos = _get_file_infos([file["id"] for file in files], access_token)
+            
+            # Persisted results of an earlier run by this user with the same file versions,
+            # prompt and settings; Clear Saved Results drops them instead
+            user = st.session_state.get("user")
+            user_id = getattr(user, "id", None) or caller_id(access_token)
+            result_keys = {
+                file["id"]: _result_store_key(
+                    file["id"], file_version_id(file_infos[file["id"]]), user_id, selected_model, categorization_prompt,
+                    (use_two_stage, confidence_threshold, use_consensus, consensus_models)
+                )
+                for file in files
+            }
+            persisted_results = {}
+            for file_id, result_key in result_keys.items():
+                if result_key is None:
+                    continue
+                if clear_button:
+                    _results_store.invalidate(result_key)
+                    continue
+                persisted_result = _results_store.get(result_key)
+                if persisted_result is not None:
+                    # Deep copy: the store's memory layer returns its own object, which
+                    # threshold statuses and overrides would otherwise modify in place
+                    persisted_results[file_id] = copy.deepcopy(persisted_result)
+        
+        if clear_button:
+            st.info(f"Cleared saved results for {len(files)} files. Start will categorize every file again.")
+        
+        # Cancelling stops the running script; show what finished so far; Start resumes
+        if cancel_button:
+            st.session_state.document_categorization = {
+                "is_categorized": bool(persisted_results),
+                "results": apply_confidence_thresholds(
+                    {file["id"]: persisted_results[file["id"]] for file in files if file["id"] in persisted_results}
+                ),
+                "errors": {}
+            }
+            st.info(f"Categorization cancelled. {len(persisted_results)} of {len(files)} files were finished and will be skipped when you start again.")
+        
         # Process categorization
         if start_button:
-            with st.spinner("Categorizing documents..."):
-                # Reset categorization results
+            with st.status("Categorizing documents...", expanded=True) as status:
+                # Reset categorization results, keeping files finished by an earlier run
                 st.session_state.document_categorization = {
                     "is_categorized": False,
-                    "results": {},
+                    "results": dict(persisted_results),
                     "errors": {}
                 }
+                pending_files = [file for file in files if file["id"] not in persisted_results]
+                if persisted_results:
+                    logger.info(f"Resuming categorization: {len(persisted_results)} of {len(files)} files already finished")
+                
+                features_cache = st.session_state.document_features_cache
+                progress_bar = st.progress(0)
+                last_progress_update = 0.0
                 
-                # Process each file
-                for file in st.session_state.selected_files:
-                    file_id = file["id"]
-                    file_name = file["name"]
+                # Process files concurrently; each file is dominated by blocking Box AI calls.
+                # Workers get everything they need as arguments; the script run's context is
+                # still attached so any logging through Streamlit from a worker thread is safe
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max(1, min(MAX_CATEGORIZATION_WORKERS, len(pending_files))),
+                    initializer=add_script_run_ctx,
+                    initargs=(None, get_script_run_ctx())
+                ) as executor:
+                    # Optionally run the first stage as a few multi-file requests
+                    first_stage_results = {}
+                    if use_batch_requests and not (use_consensus and consensus_models):
+                        status.update(label="Running batched first-stage categorization...")
+                        batch_futures = [
+                            executor.submit(
+                                categorize_documents_batch,
+                                [file["id"] for file in pending_files[start:start + batch_size]],
+                                selected_model,
+                                category_options_text,
+                                document_type_names,
+                                token_source()
+                            )
+                            for start in range(0, len(pending_files), batch_size)
+                        ]
+                        for batch_future in concurrent.futures.as_completed(batch_futures):
+                            try:
+                                first_stage_results.update(batch_future.result())
+                            except Exception as e:
+                                # Files in a failed batch fall back to per-file requests
+                                logger.warning(f"Batched categorization request failed, falling back to per-file requests: {str(e)}")
                     
-                    try:
-                        if use_consensus and consensus_models:
-                            # Multi-model consensus categorization
-                            consensus_results = []
-                            
-                            # Create progress bar for models
-                            model_progress = st.progress(0)
-                            model_status = st.empty()
-                            
-                            # Process with each model
-                            for i, model in enumerate(consensus_models):
-                                model_status.text(f"Processing with {model}...")
-                                result = categorize_document(file_id, model)
-                                consensus_results.append(result)
-                                model_progress.progress((i + 1) / len(consensus_models))
-                            
-                            # Clear progress indicators
-                            model_progress.empty()
-                            model_status.empty()
-                            
-                            # Combine results using weighted voting
-                            result = combine_categorization_results(consensus_results)
-                            
-                            # Add model details to reasoning
-                            models_text = ", ".join(consensus_models)
-                            result["reasoning"] = f"Consensus from models: {models_text}\n\n" + result["reasoning"]
-                        else:
-                            # First-stage categorization
-                            result = categorize_document(file_id, selected_model)
-                            
-                            # Check if second-stage is needed
-                            if use_two_stage and result["confidence"] < confidence_threshold:
-                                st.info(f"Low confidence ({result['confidence']:.2f}) for {file_name}, performing detailed analysis...")
-                                # Second-stage categorization with more detailed prompt
-                                detailed_result = categorize_document_detailed(file_id, selected_model, result["document_type"])
-                                
-                                # Merge results, preferring the detailed analysis
-                                result = {
-                                    "document_type": detailed_result["document_type"],
-                                    "confidence": detailed_result["confidence"],
-                                    "reasoning": detailed_result["reasoning"],
-                                    "first_stage_type": result["document_type"],
-                                    "first_stage_confidence": result["confidence"]
-                                }
-                        
-                        # Extract document features for multi-factor confidence
-                        document_features = extract_document_features(file_id)
-                        
-                        # Calculate multi-factor confidence
-                        # Extract names for calculation function
-                        document_type_names = [dtype["name"] for dtype in st.session_state.document_types]
-                        
-                        multi_factor_confidence = calculate_multi_factor_confidence(
-                            result["confidence"],
-                            document_features,
-                            result["document_type"],
-                            result.get("reasoning", ""),
-                            document_type_names # Pass only names here
+                    futures = [
+                        executor.submit(
+                            _process_one,
+                            file,
+                            selected_model,
+                            use_two_stage,
+                            use_consensus,
+                            consensus_models,
+                            confidence_threshold,
+                            document_type_names,
+                            category_options_text,
+                            categorization_prompt,
+                            token_source,
+                            features_cache,
+                            first_stage_results.get(file["id"]),
+                            file_infos.get(file["id"])
                         )
+                        for file in pending_files
+                    ]
+                    
+                    for completed, future in enumerate(concurrent.futures.as_completed(futures), start=len(persisted_results) + 1):
+                        file_id, file_name, outcome, notes = future.result()
+                        for note in notes:
+                            st.info(note)
                         
-                        # Apply confidence calibration if available
-                        calibrated_confidence = apply_confidence_calibration(
-                            result["document_type"],
-                            multi_factor_confidence["overall"]
-                        )
+                        if isinstance(outcome, Exception):
+                            logger.error(f"Error categorizing document {file_name}: {str(outcome)}")
+                            st.session_state.document_categorization["errors"][file_id] = {
+                                "file_id": file_id,
+                                "file_name": file_name,
+                                "error": str(outcome)
+                            }
+                        else:
+                            st.session_state.document_categorization["results"][file_id] = outcome
+                            if result_keys[file_id] is not None:
+                                _results_store.set(result_keys[file_id], copy.deepcopy(outcome))
                         
-                        # Store result with enhanced confidence data
-                        st.session_state.document_categorization["results"][file_id] = {
-                            "file_id": file_id,
-                            "file_name": file_name,
-                            "document_type": result["document_type"],
-                            "confidence": result["confidence"],  # Original AI confidence
-                            "multi_factor_confidence": multi_factor_confidence,  # Detailed confidence factors
-                            "calibrated_confidence": calibrated_confidence,  # Calibrated overall confidence
-                            "reasoning": result["reasoning"],
-                            "first_stage_type": result.get("first_stage_type"),
-                            "first_stage_confidence": result.get("first_stage_confidence"),
-                            "document_features": document_features
-                        }
-                    except Exception as e:
-                        logger.error(f"Error categorizing document {file_name}: {str(e)}")
-                        st.session_state.document_categorization["errors"][file_id] = {
-                            "file_id": file_id,
-                            "file_name": file_name,
-                            "error": str(e)
-                        }
+                        # Throttle UI updates; each one is a round-trip to the browser
+                        now = time.monotonic()
+                        if completed == len(files) or now - last_progress_update >= PROGRESS_UPDATE_INTERVAL:
+                            last_progress_update = now
+                            status.update(label=f"Categorized {completed}/{len(files)} files (latest: {file_name})")
+                            progress_bar.progress(completed / len(files))
+                
+                progress_bar.empty()
+                
+                # Restore selection order (futures complete in arbitrary order)
+                results = st.session_state.document_categorization["results"]
+                ordered_results = {file["id"]: results[file["id"]] for file in files if file["id"] in results}
                 
                 # Apply confidence thresholds
-                st.session_state.document_categorization["results"] = apply_confidence_thresholds(
-                    st.session_state.document_categorization["results"]
-                )
+                st.session_state.document_categorization["results"] = apply_confidence_thresholds(ordered_results)
                 
                 # Mark as categorized
                 st.session_state.document_categorization["is_categorized"] = True
@@ -259,8 +423,10 @@ def document_categorization():
                 num_errors = len(st.session_state.document_categorization["errors"])
                 
                 if num_errors == 0:
+                    status.update(label="Categorization complete", state="complete", expanded=False)
                     st.success(f"Categorization complete! Processed {num_processed} files.")
                 else:
+                    status.update(label="Categorization complete with errors", state="error")
                     st.warning(f"Categorization complete! Processed {num_processed} files with {num_errors} errors.")
         
         # Display categorization results
@@ -282,6 +448,110 @@ def document_categorization():
         with st.expander("Confidence Validation", expanded=False):
             validate_confidence_with_examples()
 
+def _process_one(file: Dict[str, Any], selected_model: str, use_two_stage: bool, use_consensus: bool,
+                 consensus_models: List[str], confidence_threshold: float,
+                 document_type_names: List[str], category_options_text: str, categorization_prompt: str,
+                 token_source: Callable[[], str], features_cache: Dict[str, Any],
+                 first_stage_result: Optional[Dict[str, Any]] = None,
+                 file_info: Optional[Dict[str, Any]] = None) -> Tuple[str, str, Any, List[str]]:
+    """
+    Categorize a single file. Runs in a worker thread, so it makes no Streamlit calls
+    and does not read session state; the caller passes in the features cache and a
+    token source, which is read once per file so a refreshed token is picked up.
+    If first_stage_result is given (from categorize_documents_batch), the first-stage
+    request for this file is skipped. file_info (from _get_file_infos) supplies the
+    file version for cache keys and the features, so the worker needn't look it up.
+    
+    Returns:
+        tuple: (file_id, file_name, result dict or the exception raised, notes to show the user)
+    """
+    file_id = file["id"]
+    file_name = file["name"]
+    version_id = file_version_id(file_info)
+    notes = []
+    
+    try:
+        access_token = token_source()
+        
+        if use_consensus and consensus_models:
+            # Multi-model consensus categorization: the model calls are independent,
+            # so run them concurrently (map keeps results in consensus_models order)
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(consensus_models),
+                initializer=add_script_run_ctx,
+                initargs=(None, get_script_run_ctx())
+            ) as model_executor:
+                consensus_results = list(model_executor.map(
+                    lambda model: categorize_document(
+                        file_id, model, categorization_prompt, document_type_names, access_token, version_id
+                    ),
+                    consensus_models
+                ))
+            
+            # Combine results using weighted voting
+            result = combine_categorization_results(consensus_results)
+            
+            # Add model details to reasoning
+            models_text = ", ".join(consensus_models)
+            result["reasoning"] = f"Consensus from models: {models_text}\n\n" + result["reasoning"]
+        else:
+            # First-stage categorization
+            result = first_stage_result or categorize_document(
+                file_id, selected_model, categorization_prompt, document_type_names, access_token, version_id
+            )
+            
+            # Check if second-stage is needed
+            if use_two_stage and result["confidence"] < confidence_threshold:
+                notes.append(f"Low confidence ({result['confidence']:.2f}) for {file_name}, performed detailed analysis.")
+                # Second-stage categorization with more detailed prompt
+                detailed_result = categorize_document_detailed(
+                    file_id, selected_model, result["document_type"], category_options_text, document_type_names,
+                    access_token, version_id
+                )
+                
+                # Merge results, preferring the detailed analysis
+                result = {
+                    "document_type": detailed_result["document_type"],
+                    "confidence": detailed_result["confidence"],
+                    "reasoning": detailed_result["reasoning"],
+                    "first_stage_type": result["document_type"],
+                    "first_stage_confidence": result["confidence"]
+                }
+        
+        # Extract document features for multi-factor confidence
+        document_features = extract_document_features(file_id, access_token, features_cache, file_info)
+        
+        # Calculate multi-factor confidence
+        multi_factor_confidence = calculate_multi_factor_confidence(
+            result["confidence"],
+            document_features,
+            result["document_type"],
+            result.get("reasoning", ""),
+            document_type_names # Pass only names here
+        )
+        
+        # Apply confidence calibration if available
+        calibrated_confidence = apply_confidence_calibration(
+            result["document_type"],
+            multi_factor_confidence["overall"]
+        )
+        
+        # Result with enhanced confidence data
+        return file_id, file_name, {
+            "file_id": file_id,
+            "file_name": file_name,
+            "document_type": result["document_type"],
+            "confidence": result["confidence"],  # Original AI confidence
+            "multi_factor_confidence": multi_factor_confidence,  # Detailed confidence factors
+            "calibrated_confidence": calibrated_confidence,  # Calibrated overall confidence
+            "reasoning": result["reasoning"],
+            "first_stage_type": result.get("first_stage_type"),
+            "first_stage_confidence": result.get("first_stage_confidence"),
+            "document_features": document_features
+        }, notes
+    except Exception as e:
+        return file_id, file_name, e, notes
+
 def configure_document_types():
     """
     Configure user-defined document types with descriptions.
@@ -302,73 +572,84 @@ def configure_document_types():
         ]
         logger.warning("Document types state was missing or invalid, reset to default structure.")
 
-    # Display current document types with descriptions and delete buttons
-    indices_to_delete = []
-    for i, doc_type_dict in enumerate(st.session_state.document_types):
-        is_other_type = doc_type_dict.get("name") == "Other"
-        
-        with st.container():
+    # Edit names/descriptions in a form so typing doesn't rerun the page;
+    # changes are applied together when the form is submitted
+    with st.form("doc_types_form", clear_on_submit=False):
+        edited_types = []
+        for i, doc_type_dict in enumerate(st.session_state.document_types):
+            is_other_type = doc_type_dict.get("name") == "Other"
+            
             st.markdown(f"**Document Type {i+1}**")
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                # Input for Name
-                current_name = doc_type_dict.get("name", "")
-                new_name = st.text_input(
-                    f"Name", 
-                    value=current_name, 
-                    key=f"doc_type_name_{i}", 
-                    disabled=is_other_type, 
-                    help="The name of the document category."
-                )
-                if new_name != current_name and not is_other_type:
-                    # Check for duplicate names before updating
-                    if any(d["name"] == new_name for j, d in enumerate(st.session_state.document_types) if i != j):
-                        st.warning(f"Document type name '{new_name}' already exists.")
-                    else:
-                        st.session_state.document_types[i]["name"] = new_name
-                        logger.info(f"Updated document type name at index {i} to: {new_name}")
-                        # No rerun here, allow multiple edits before rerun
-
-                # Input for Description
-                current_desc = doc_type_dict.get("description", "")
-                new_desc = st.text_area(
-                    f"Description", 
-                    value=current_desc, 
-                    key=f"doc_type_desc_{i}", 
-                    disabled=is_other_type, 
-                    height=100,
-                    help="Provide a clear description for the AI to understand this category."
-                )
-                if new_desc != current_desc and not is_other_type:
-                    st.session_state.document_types[i]["description"] = new_desc
-                    logger.info(f"Updated document type description at index {i}")
-                    # No rerun here
-
-            with col2:
-                # Delete button (disabled for "Other")
-                st.write("&nbsp;") # Add space for alignment
-                if st.button("Delete", key=f"delete_type_{i}", disabled=is_other_type):
-                    indices_to_delete.append(i)
-                    logger.info(f"Marked document type at index {i} for deletion.")
+            # Input for Name
+            new_name = st.text_input(
+                f"Name", 
+                value=doc_type_dict.get("name", ""), 
+                key=f"doc_type_name_{i}", 
+                disabled=is_other_type, 
+                help="The name of the document category."
+            )
+            # Input for Description
+            new_desc = st.text_area(
+                f"Description", 
+                value=doc_type_dict.get("description", ""), 
+                key=f"doc_type_desc_{i}", 
+                disabled=is_other_type, 
+                height=100,
+                help="Provide a clear description for the AI to understand this category."
+            )
+            edited_types.append((new_name, new_desc))
             st.markdown("---")
-
-    # Process deletions if any button was pressed
-    if indices_to_delete:
-        # Sort indices in reverse order to avoid index shifting issues during deletion
-        indices_to_delete.sort(reverse=True)
-        for index in indices_to_delete:
-            deleted_type = st.session_state.document_types.pop(index)
-            logger.info(f"Deleted document type: {deleted_type.get('name')}")
+        
+        submitted = st.form_submit_button("Save changes")
+    
+    if submitted:
+        changed = False
+        name_counts = Counter(d["name"] for d in st.session_state.document_types)
+        for i, (new_name, new_desc) in enumerate(edited_types):
+            doc_type_dict = st.session_state.document_types[i]
+            if doc_type_dict.get("name") == "Other":
+                continue
+            
+            current_name = doc_type_dict.get("name", "")
+            if new_name != current_name:
+                # Check for duplicate names before updating
+                if name_counts[new_name] > 0:
+                    st.warning(f"Document type name '{new_name}' already exists.")
+                else:
+                    name_counts[current_name] -= 1
+                    name_counts[new_name] += 1
+                    doc_type_dict["name"] = new_name
+                    changed = True
+                    logger.info(f"Updated document type name at index {i} to: {new_name}")
+            
+            if new_desc != doc_type_dict.get("description", ""):
+                doc_type_dict["description"] = new_desc
+                changed = True
+                logger.info(f"Updated document type description at index {i}")
+        
+        if changed:
+            st.rerun() # Rerun so the rest of the page sees the saved types
+    
+    # Deletions stay outside the form because they take effect immediately
+    deletable_names = [d["name"] for d in st.session_state.document_types if d.get("name") != "Other"]
+    names_to_delete = st.multiselect("Select document types to delete", options=deletable_names, key="doc_types_to_delete")
+    if st.button("Delete Selected", key="delete_doc_types_button", disabled=not names_to_delete):
+        st.session_state.document_types = [
+            d for d in st.session_state.document_types if d.get("name") not in names_to_delete
+        ]
+        logger.info(f"Deleted document types: {names_to_delete}")
         st.rerun() # Rerun after deletion to update the UI
 
     # Add new document type section
     st.write("**Add New Document Type**")
-    new_type_name = st.text_input("New Type Name", key="new_doc_type_name")
-    new_type_desc = st.text_area("New Type Description", key="new_doc_type_desc", height=100)
+    with st.form("add_doc_type_form", clear_on_submit=True):
+        new_type_name = st.text_input("New Type Name", key="new_doc_type_name")
+        new_type_desc = st.text_area("New Type Description", key="new_doc_type_desc", height=100)
+        add_submitted = st.form_submit_button("Add Document Type")
     
-    if st.button("Add Document Type") and new_type_name:
+    if add_submitted and new_type_name:
         # Check if name already exists
-        if any(d['name'] == new_type_name for d in st.session_state.document_types):
+        if new_type_name in {d['name'] for d in st.session_state.document_types}:
             st.warning(f"Document type name '{new_type_name}' already exists.")
         else:
             new_doc_type = {"name": new_type_name, "description": new_type_desc}
@@ -390,10 +671,24 @@ def configure_document_types():
         logger.info("Reset document types to default values.")
         st.rerun()
 
+def _results_column(records: "pd.DataFrame", column: str, default: Any) -> "pd.Series":
+    """
+    Column of the results DataFrame with missing values (or a missing column) set to default.
+    """
+    import pandas as pd
+    
+    if column in records:
+        return records[column].fillna(default)
+    return pd.Series(default, index=records.index)
+
 def display_categorization_results():
     """
     Display categorization results with enhanced confidence visualization
     """
+    # pandas is only needed once there are results to show, so import it here
+    # rather than on every page load
+    import pandas as pd
+    
     st.write("### Categorization Results")
     
     # Get results from session state
@@ -410,39 +705,38 @@ def display_categorization_results():
     tab1, tab2 = st.tabs(["Table View", "Detailed View"])
     
     with tab1:
-        # Create a table of results with enhanced confidence display
-        results_data = []
-        for file_id, result in results.items():
-            # Determine status based on thresholds
-            status = result.get("status", "Review")
-            
-            # Determine confidence level and color
-            confidence = result.get("calibrated_confidence", result.get("confidence", 0.0))
-            if confidence >= 0.8:
-                confidence_level = "High"
-                confidence_color = "green"
-            elif confidence >= 0.6:
-                confidence_level = "Medium"
-                confidence_color = "orange"
-            else:
-                confidence_level = "Low"
-                confidence_color = "red"
+        # Build the table column-wise from the result records in one pandas pipeline
+        if results:
+            records = pd.DataFrame.from_records(list(results.values()))
+            confidence = _results_column(records, "confidence", 0.0)
+            if "calibrated_confidence" in records:
+                confidence = records["calibrated_confidence"].fillna(confidence)
             
-            results_data.append({
-                "File Name": result.get("file_name", "Unknown"),
-                "Document Type": result.get("document_type", "N/A"),
-                "Confidence": f"<span style='color: {confidence_color};'>{confidence_level} ({confidence:.2f})</span>",
-                "Status": status
+            df = pd.DataFrame({
+                "File Name": _results_column(records, "file_name", "Unknown"),
+                "Document Type": _results_column(records, "document_type", "N/A"),
+                "Confidence": confidence.astype("float64"),
+                "Status": _results_column(records, "status", "Review")
             })
-        
-        if results_data:
-            # Convert to DataFrame for display
-            df = pd.DataFrame(results_data)
             
-            # Display as HTML to preserve formatting
-            st.markdown(
-                df.to_html(escape=False, index=False),
-                unsafe_allow_html=True
+            # Bucket confidence: High >= 0.8, Medium >= 0.6, otherwise Low
+            df.insert(3, "Confidence Level", pd.cut(
+                df["Confidence"],
+                bins=[float("-inf"), 0.6, 0.8, float("inf")],
+                labels=["Low", "Medium", "High"],
+                right=False
+            ))
+            
+            st.dataframe(
+                df,
+                column_config={
+                    "Confidence": st.column_config.ProgressColumn(
+                        "Confidence", format="%.2f", min_value=0.0, max_value=1.0
+                    ),
+                    "Status": st.column_config.TextColumn("Status")
+                },
+                hide_index=True,
+                use_container_width=True
             )
         else:
             st.info("No results to display in table view.")
@@ -560,49 +854,192 @@ def display_categorization_results():
             st.session_state.current_page = "Metadata Configuration"
             st.rerun()
 
-def categorize_document(file_id: str, model: str = "azure__openai__gpt_4o_mini") -> Dict[str, Any]:
+def build_category_options_text(document_types: List[Dict[str, str]]) -> str:
+    """
+    Format the document types and their descriptions as the option list used in prompts.
+    """
+    return "\n".join([f"- {dtype['name']}: {dtype['description']}" for dtype in document_types])
+
+class CategorizationAnswer(TypedDict):
+    """
+    Parsed Box AI answer for one file. Kept a plain dict: answers are cached as JSON,
+    stored in session state and loaded into DataFrames, all of which expect mappings.
+    """
+    document_type: str
+    confidence: float
+    reasoning: str
+
+class CategoryOptions(NamedTuple):
+    """Prompt pieces derived from the configured document types"""
+    names: Tuple[str, ...]
+    options_text: str
+    categorization_prompt: str
+
+@functools.lru_cache(maxsize=32)
+def _category_options_for(types_key: Tuple[Tuple[str, str], ...]) -> CategoryOptions:
+    document_types = [{"name": name, "description": description} for name, description in types_key]
+    options_text = build_category_options_text(document_types)
+    return CategoryOptions(
+        names=tuple(name for name, _ in types_key),
+        options_text=options_text,
+        categorization_prompt=build_categorization_prompt(options_text)
+    )
+
+def get_category_options(document_types: List[Dict[str, str]]) -> CategoryOptions:
+    """
+    Category names, option list and first-stage prompt for the given document types.
+    Memoized on the names and descriptions, so edits to the types produce fresh text.
+    Types are sorted by name, so reordering them in the UI keeps prompts (and cache keys) identical.
+    """
+    return _category_options_for(tuple(sorted(
+        (dtype["name"], dtype.get("description", "")) for dtype in document_types
+    )))
+
+def build_categorization_prompt_prefix(category_options_text: str) -> str:
+    """
+    Shared opening of the first-stage and detailed prompts: the category list and answer format.
+    It is byte-identical for both stages and all files so providers can reuse the processed prefix.
+    """
+    return (
+        f"Consider the following document categories and their descriptions:\n"
+        f"{category_options_text}\n\n"
+        f"Provide your final answer ONLY in the following format (exactly three lines):\n"
+        f"Category: [selected category name]\n"
+        f"Confidence: [confidence score between 0 and 1, where 1 is highest confidence]\n"
+        f"Reasoning: [detailed explanation of your categorization, including specific evidence from the document that supports it]\n"
+        f"---\n"
+    )
+
+def build_categorization_prompt(category_options_text: str) -> str:
+    """
+    Create prompt for document categorization with confidence score request
+    """
+    return (
+        build_categorization_prompt_prefix(category_options_text) +
+        "Analyze this document and determine which of the categories above it belongs to."
+    )
+
+def build_detailed_categorization_prompt(category_options_text: str, initial_category: str) -> str:
+    """
+    Create the more detailed prompt for second-stage analysis
+    """
+    return (
+        build_categorization_prompt_prefix(category_options_text) +
+        f"Analyze this document in detail to determine its category. "
+        f"The initial categorization suggested it might be '{initial_category}', but we need a more thorough analysis.\n"
+        f"For each category listed above, provide a score from 0-10 indicating how well the document matches that category, "
+        f"along with specific evidence from the document supporting your score. "
+        f"Finally, give your definitive categorization in the answer format above."
+    )
+
+def _get_file_infos(file_ids: List[str], access_token: str) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Look up the file info of several files concurrently, once per run, so workers get
+    each file's version and features without requests of their own.
+    Files whose lookup fails map to None.
+    """
+    def _lookup(file_id):
+        try:
+            return get_file_info(file_id, access_token)
+        except Exception as e:
+            logger.warning(f"Could not get file info for {file_id}: {e}")
+            return None
+    
+    if not file_ids:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_CATEGORIZATION_WORKERS, len(file_ids))) as executor:
+        return dict(zip(file_ids, executor.map(_lookup, file_ids)))
+
+def _normalize_prompt(prompt: str) -> str:
+    """
+    Prompt text as used in cache keys: whitespace differences (e.g. from re-typed
+    document type descriptions) don't change the answer, so they don't miss the cache.
+    Case is kept, since category names are matched case-sensitively in the answer.
+    """
+    return " ".join(prompt.split())
+
+def _result_store_key(file_id: str, version_id: Optional[str], user_id: str, model: str, prompt: str,
+                      run_options: Tuple) -> Optional[str]:
+    """
+    Key for a finished per-file result: file version, user, model, a hash of the prompt
+    and the options that change the result (two-stage, threshold, consensus models),
+    so a new upload or another user's run is never resumed from it.
+    Returns None (result not saved) if the file version is unknown.
+    """
+    if version_id is None:
+        return None
+    prompt_sha1 = hashlib.sha1(_normalize_prompt(prompt).encode("utf-8")).hexdigest()
+    return _results_store.generate_key("result", file_id, version_id, user_id, model, prompt_sha1, run_options)
+
+def _ask_cache_key(stage: str, file_id: str, model: str, prompt: str, access_token: str) -> str:
+    """
+    Exact-match key for the in-process answer cache; stage keeps first-stage and
+    detailed answers apart, and the caller keeps sessions apart
+    """
+    return stage + ":" + hashlib.sha256(
+        f"{caller_id(access_token)}\x1f{model}\x1f{file_id}\x1f{_normalize_prompt(prompt)}".encode("utf-8")
+    ).hexdigest()
+
+def _categorization_cache_key(file_id: str, model: str, prompt: str, access_token: str,
+                              version_id: Optional[str] = None) -> Optional[str]:
+    """
+    Cache key for a categorization answer: file version, model and a hash of the prompt,
+    so a new file version or edited document types miss the cache. The version is
+    looked up unless the caller already has it.
+    Returns None (no caching) if the file version cannot be determined.
+    """
+    if version_id is None:
+        try:
+            version_id = get_file_info(file_id, access_token)["file_version"]["id"]
+        except Exception as e:
+            logger.warning(f"Could not determine file version for {file_id}, categorization will not be cached: {e}")
+            return None
+    prompt_sha1 = hashlib.sha1(_normalize_prompt(prompt).encode("utf-8")).hexdigest()
+    return _categorization_cache.generate_key("categorize", file_id, version_id, model, prompt_sha1)
+
+def categorize_document(file_id: str, model: str = "azure__openai__gpt_4o_mini",
+                        prompt: Optional[str] = None,
+                        document_type_names: Optional[List[str]] = None,
+                        access_token: Optional[str] = None,
+                        version_id: Optional[str] = None) -> CategorizationAnswer:
     """
     Categorize a document using Box AI
     
     Args:
         file_id: Box file ID
         model: AI model to use for categorization
+        prompt: Prebuilt categorization prompt (built from session state if omitted)
+        document_type_names: Valid category names (read from session state if omitted)
+        access_token: Box access token (read from the session's client if omitted)
+        version_id: Current file version for the cache key (looked up if omitted)
         
     Returns:
         dict: Document categorization result
     """
-    # Get access token from client
-    access_token = None
-    if hasattr(st.session_state.client, '_oauth'):
-        access_token = st.session_state.client._oauth.access_token
-    elif hasattr(st.session_state.client, 'auth') and hasattr(st.session_state.client.auth, 'access_token'):
-        access_token = st.session_state.client.auth.access_token
-    
-    if not access_token:
-        raise ValueError("Could not retrieve access token from client")
-    
-    # Set headers
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
+    # Get access token from client unless the caller already fetched it
+    if access_token is None:
+        access_token = get_access_token(st.session_state.client)
+    headers = box_ai_headers(access_token)
     
-    # Get document types (list of dicts) from session state
-    document_types_with_desc = st.session_state.document_types
-    document_type_names = [dtype['name'] for dtype in document_types_with_desc]
+    # Get document types (list of dicts) from session state unless precomputed by the caller
+    if document_type_names is None or prompt is None:
+        category_options = get_category_options(st.session_state.document_types)
+        if document_type_names is None:
+            document_type_names = category_options.names
+        if prompt is None:
+            prompt = category_options.categorization_prompt
     
-    # Create prompt for document categorization with confidence score request
-    # Include descriptions in the prompt
-    category_options_text = "\n".join([f"- {dtype['name']}: {dtype['description']}" for dtype in document_types_with_desc])
-    
-    prompt = (
-        f"Analyze this document and determine which category it belongs to from the following options:\n"
-        f"{category_options_text}\n\n"
-        f"Provide your answer ONLY in the following format (exactly two lines):\n"
-        f"Category: [selected category name]\n"
-        f"Confidence: [confidence score between 0 and 1, where 1 is highest confidence]\n"
-        f"Reasoning: [detailed explanation of your categorization, including key features of the document that support this categorization]"
-    )
+    # Return a recent in-process answer, then a cached answer for the same file version, model and prompt
+    ask_key = _ask_cache_key("categorize", file_id, model, prompt, access_token)
+    cached_result = _ask_cache.get(ask_key)
+    if cached_result is not None:
+        return cached_result
+    cache_key = _categorization_cache_key(file_id, model, prompt, access_token, version_id)
+    cached_result = _categorization_cache.get(cache_key) if cache_key else None
+    if cached_result is not None:
+        logger.info(f"Using cached categorization for file {file_id} with model {model}")
+        _ask_cache.set(ask_key, cached_result)
+        return dict(cached_result)
     
     # Construct API URL for Box AI Ask
     api_url = "https://api.box.com/2.0/ai/ask"
@@ -628,8 +1065,10 @@ def categorize_document(file_id: str, model: str = "azure__openai__gpt_4o_mini")
     
     try:
         # Make API call
-        logger.info(f"Making Box AI API call with request: {json.dumps(request_body)}")
-        response = requests.post(api_url, headers=headers, json=request_body)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Box AI request: %s", json.dumps(request_body))
+        logger.info("Making Box AI API call: file=%s model=%s", file_id, model)
+        response = _post_box_ai(api_url, headers, request_body)
         
         # Log response for debugging
         logger.info(f"Box AI API response status: {response.status_code}")
@@ -645,8 +1084,9 @@ def categorize_document(file_id: str, model: str = "azure__openai__gpt_4o_mini")
             raise Exception(f"Error in Box AI API call: {response.status_code}. Details: {error_details}")
         
         # Parse response
-        response_data = response.json()
-        logger.info(f"Box AI API response data: {json.dumps(response_data)}")
+        response_data = json_loads(response.content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Box AI response data: %s", json.dumps(response_data))
         
         # Extract answer from response
         if "answer" in response_data:
@@ -655,11 +1095,15 @@ def categorize_document(file_id: str, model: str = "azure__openai__gpt_4o_mini")
             # Parse the structured response to extract category, confidence, and reasoning
             document_type, confidence, reasoning = parse_categorization_response(answer_text, document_type_names)
             
-            return {
+            result = {
                 "document_type": document_type,
                 "confidence": confidence,
                 "reasoning": reasoning
             }
+            if cache_key:
+                _categorization_cache.set(cache_key, result)
+            _ask_cache.set(ask_key, result)
+            return dict(result)
         
         # If no answer in response, return default
         logger.warning(f"No 'answer' field found in Box AI response for file {file_id}. Response: {response_data}")
@@ -673,7 +1117,147 @@ def categorize_document(file_id: str, model: str = "azure__openai__gpt_4o_mini")
         logger.exception(f"Error during Box AI API call or parsing for file {file_id}: {str(e)}")
         raise Exception(f"Error categorizing document {file_id}: {str(e)}")
 
-def categorize_document_detailed(file_id: str, model: str, initial_category: str) -> Dict[str, Any]:
+def categorize_documents_batch(file_ids: List[str], model: str = "azure__openai__gpt_4o_mini",
+                               category_options_text: Optional[str] = None,
+                               document_type_names: Optional[List[str]] = None,
+                               access_token: Optional[str] = None) -> Dict[str, CategorizationAnswer]:
+    """
+    Categorize several documents with a single Box AI request (multiple_item_qa)
+    
+    Args:
+        file_ids: Box file IDs to categorize together
+        model: AI model to use for categorization
+        category_options_text: Prebuilt category list for the prompt (built from session state if omitted)
+        document_type_names: Valid category names (read from session state if omitted)
+        access_token: Box access token (read from the session's client if omitted)
+        
+    Returns:
+        dict: Document categorization result per file ID. Files the AI did not
+              return a usable entry for are omitted, so callers can fall back to
+              categorize_document for them.
+    """
+    # A single file gains nothing from the batch prompt; use the regular (cached) path
+    if len(file_ids) == 1:
+        return {file_ids[0]: categorize_document(
+            file_ids[0], model,
+            build_categorization_prompt(category_options_text) if category_options_text is not None else None,
+            document_type_names, access_token
+        )}
+    
+    # Get access token from client unless the caller already fetched it
+    if access_token is None:
+        access_token = get_access_token(st.session_state.client)
+    headers = box_ai_headers(access_token)
+    
+    # Get document types (list of dicts) from session state unless precomputed by the caller
+    if document_type_names is None or category_options_text is None:
+        category_options = get_category_options(st.session_state.document_types)
+        if document_type_names is None:
+            document_type_names = category_options.names
+        if category_options_text is None:
+            category_options_text = category_options.options_text
+    
+    prompt = (
+        f"Analyze each of the provided documents separately and determine which category each belongs to from the following options:\n"
+        f"{category_options_text}\n\n"
+        f"The documents have these file IDs: {', '.join(file_ids)}\n\n"
+        f"Provide your answer ONLY as a JSON array with exactly one object per document, in this format:\n"
+        f'[{{"file_id": "[file ID]", "document_type": "[selected category name]", '
+        f'"confidence": [confidence score between 0 and 1, where 1 is highest confidence], '
+        f'"reasoning": "[short explanation of your categorization]"}}]'
+    )
+    
+    # Construct API URL for Box AI Ask
+    api_url = "https://api.box.com/2.0/ai/ask"
+    
+    request_body = {
+        "mode": "multiple_item_qa",
+        "prompt": prompt,
+        "items": [{"type": "file", "id": file_id} for file_id in file_ids],
+        "ai_agent": {
+            "type": "ai_agent_ask",
+            "basic_text": {
+                "model": model,
+                "mode": "default"
+            }
+        }
+    }
+    
+    try:
+        # Make API call
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Batched Box AI request: %s", json.dumps(request_body))
+        logger.info("Making batched Box AI API call: files=%d model=%s", len(file_ids), model)
+        response = _post_box_ai(api_url, headers, request_body)
+        
+        if response.status_code != 200:
+            logger.error(f"Box AI API error response: {response.text}")
+            error_details = "Unknown error"
+            try:
+                error_json = response.json()
+                error_details = error_json.get('message', response.text)
+            except json.JSONDecodeError:
+                error_details = response.text
+            raise Exception(f"Error in batched Box AI API call: {response.status_code}. Details: {error_details}")
+        
+        response_data = json_loads(response.content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Batched Box AI response data: %s", json.dumps(response_data))
+        
+        return parse_batch_categorization_response(response_data.get("answer", ""), file_ids, document_type_names)
+    
+    except Exception as e:
+        logger.exception(f"Error during batched Box AI API call or parsing for files {file_ids}: {str(e)}")
+        raise Exception(f"Error categorizing documents {file_ids}: {str(e)}")
+
+def parse_batch_categorization_response(response_text: str, file_ids: List[str], valid_categories: List[str]) -> Dict[str, CategorizationAnswer]:
+    """
+    Parse the JSON array answer of a batched categorization request.
+    
+    Returns:
+        dict: {"document_type", "confidence", "reasoning"} per requested file ID found in the answer.
+    """
+    results = {}
+    array_match = _JSON_ARRAY_RE.search(response_text or "")
+    if not array_match:
+        logger.warning(f"Could not find a JSON array in batched response: {response_text}")
+        return results
+    
+    try:
+        entries = json_loads(array_match.group(0))
+    except json.JSONDecodeError as e:
+        logger.warning(f"Could not parse batched response as JSON: {str(e)}. Response text: {response_text}")
+        return results
+    
+    requested = set(file_ids)
+    valid_set = frozenset(valid_categories)
+    for entry in entries:
+        if not isinstance(entry, dict) or str(entry.get("file_id")) not in requested:
+            continue
+        
+        document_type = entry.get("document_type", "Other")
+        if document_type not in valid_set:
+            logger.warning(f"Extracted category '{document_type}' not in valid list: {valid_categories}. Defaulting to 'Other'.")
+            document_type = "Other"
+        
+        try:
+            confidence = max(0.0, min(1.0, float(entry.get("confidence", 0.0))))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        
+        results[str(entry["file_id"])] = {
+            "document_type": document_type,
+            "confidence": confidence,
+            "reasoning": entry.get("reasoning") or "Reasoning not provided or parsing failed."
+        }
+    
+    return results
+
+def categorize_document_detailed(file_id: str, model: str, initial_category: str,
+                                 category_options_text: Optional[str] = None,
+                                 document_type_names: Optional[List[str]] = None,
+                                 access_token: Optional[str] = None,
+                                 version_id: Optional[str] = None) -> CategorizationAnswer:
     """
     Perform a more detailed categorization for documents with low confidence
     
@@ -681,45 +1265,41 @@ def categorize_document_detailed(file_id: str, model: str, initial_category: str
         file_id: Box file ID
         model: AI model to use for categorization
         initial_category: Initial category from first-stage categorization
+        category_options_text: Prebuilt category list for the prompt (built from session state if omitted)
+        document_type_names: Valid category names (read from session state if omitted)
+        access_token: Box access token (read from the session's client if omitted)
+        version_id: Current file version for the cache key (looked up if omitted)
         
     Returns:
         dict: Document categorization result
     """
-    # Get access token from client
-    access_token = None
-    if hasattr(st.session_state.client, '_oauth'):
-        access_token = st.session_state.client._oauth.access_token
-    elif hasattr(st.session_state.client, 'auth') and hasattr(st.session_state.client.auth, 'access_token'):
-        access_token = st.session_state.client.auth.access_token
-    
-    if not access_token:
-        raise ValueError("Could not retrieve access token from client")
-    
-    # Set headers
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
+    # Get access token from client unless the caller already fetched it
+    if access_token is None:
+        access_token = get_access_token(st.session_state.client)
+    headers = box_ai_headers(access_token)
     
-    # Get document types (list of dicts) from session state
-    document_types_with_desc = st.session_state.document_types
-    document_type_names = [dtype['name'] for dtype in document_types_with_desc]
+    # Get document types (list of dicts) from session state unless precomputed by the caller
+    if document_type_names is None or category_options_text is None:
+        category_options = get_category_options(st.session_state.document_types)
+        if document_type_names is None:
+            document_type_names = category_options.names
+        if category_options_text is None:
+            category_options_text = category_options.options_text
     
     # Create a more detailed prompt for second-stage analysis, including descriptions
-    category_options_text = "\n".join([f"- {dtype['name']}: {dtype['description']}" for dtype in document_types_with_desc])
-
-    prompt = (
-        f"Analyze this document in detail to determine its category. "
-        f"The initial categorization suggested it might be '{initial_category}', but we need a more thorough analysis.\n\n"
-        f"Consider the following categories and their descriptions:\n"
-        f"{category_options_text}\n\n"
-        f"For each category listed above, provide a score from 0-10 indicating how well the document matches that category, "
-        f"along with specific evidence from the document supporting your score.\n\n"
-        f"Finally, provide your definitive categorization ONLY in the following format (exactly two lines):\n"
-        f"Category: [selected category name]\n"
-        f"Confidence: [confidence score between 0 and 1, where 1 is highest confidence]\n"
-        f"Reasoning: [detailed explanation with specific evidence from the document supporting your final choice]"
-    )
+    prompt = build_detailed_categorization_prompt(category_options_text, initial_category)
+    
+    # Return a recent in-process answer, then a cached answer for the same file version, model and prompt
+    ask_key = _ask_cache_key("detailed", file_id, model, prompt, access_token)
+    cached_result = _ask_cache.get(ask_key)
+    if cached_result is not None:
+        return cached_result
+    cache_key = _categorization_cache_key(file_id, model, prompt, access_token, version_id)
+    cached_result = _categorization_cache.get(cache_key) if cache_key else None
+    if cached_result is not None:
+        logger.info(f"Using cached detailed categorization for file {file_id} with model {model}")
+        _ask_cache.set(ask_key, cached_result)
+        return dict(cached_result)
     
     # Construct API URL for Box AI Ask
     api_url = "https://api.box.com/2.0/ai/ask"
@@ -745,8 +1325,10 @@ def categorize_document_detailed(file_id: str, model: str, initial_category: str
     
     try:
         # Make API call
-        logger.info(f"Making detailed Box AI API call with request: {json.dumps(request_body)}")
-        response = requests.post(api_url, headers=headers, json=request_body)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Detailed Box AI request: %s", json.dumps(request_body))
+        logger.info("Making detailed Box AI API call: file=%s model=%s", file_id, model)
+        response = _post_box_ai(api_url, headers, request_body)
         
         # Check response
         if response.status_code != 200:
@@ -761,8 +1343,9 @@ def categorize_document_detailed(file_id: str, model: str, initial_category: str
             raise Exception(f"Error in detailed Box AI API call: {response.status_code}. Details: {error_details}")
         
         # Parse response
-        response_data = response.json()
-        logger.info(f"Detailed Box AI API response data: {json.dumps(response_data)}")
+        response_data = json_loads(response.content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Detailed Box AI response data: %s", json.dumps(response_data))
         
         # Extract answer from response
         if "answer" in response_data:
@@ -771,11 +1354,15 @@ def categorize_document_detailed(file_id: str, model: str, initial_category: str
             # Parse the structured response
             document_type, confidence, reasoning = parse_categorization_response(answer_text, document_type_names)
             
-            return {
+            result = {
                 "document_type": document_type,
                 "confidence": confidence,
                 "reasoning": reasoning
             }
+            if cache_key:
+                _categorization_cache.set(cache_key, result)
+            _ask_cache.set(ask_key, result)
+            return dict(result)
         
         # If no answer, return default
         logger.warning(f"No 'answer' field found in detailed Box AI response for file {file_id}. Response: {response_data}")
@@ -808,9 +1395,9 @@ def parse_categorization_response(response_text: str, valid_categories: List[str
 
     try:
         # Use regex to find Category, Confidence, and Reasoning, allowing for variations
-        category_match = re.search(r"^Category:\s*(.*?)$", response_text, re.MULTILINE | re.IGNORECASE)
-        confidence_match = re.search(r"^Confidence:\s*([0-9.]+)", response_text, re.MULTILINE | re.IGNORECASE)
-        reasoning_match = re.search(r"^Reasoning:\s*(.*)", response_text, re.MULTILINE | re.IGNORECASE | re.DOTALL)
+        category_match = _CATEGORY_RE.search(response_text)
+        confidence_match = _CONFIDENCE_RE.search(response_text)
+        reasoning_match = _REASONING_RE.search(response_text)
 
         if category_match:
             extracted_category = category_match.group(1).strip()
@@ -849,22 +1436,40 @@ def parse_categorization_response(response_text: str, valid_categories: List[str
 
     return document_type, confidence, reasoning
 
-def extract_document_features(file_id: str) -> Dict[str, Any]:
+def extract_document_features(file_id: str, access_token: Optional[str] = None,
+                              features_cache: Optional[Dict[str, Any]] = None,
+                              file_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Extract basic features from the document (e.g., file type, size, keywords)
     Placeholder function - needs actual implementation
+    When the caller passes the file's current file_info, the features are computed
+    from it. Otherwise results are reused for DOCUMENT_FEATURES_TTL seconds within the
+    Streamlit session (see bust_feature_cache). The access token and features cache
+    are read from session state if omitted.
     """
+    if features_cache is None:
+        features_cache = st.session_state.get("document_features_cache")
+    if features_cache is not None and file_info is None:
+        cached = features_cache.get(file_id)
+        if cached and time.time() - cached[0] < DOCUMENT_FEATURES_TTL:
+            return dict(cached[1])
+    
     # Placeholder: Replace with actual feature extraction logic
     # Example: Use Box API to get file info, maybe extract text snippet
     try:
-        client = st.session_state.client
-        file_info = client.file(file_id).get(fields=["size", "name", "extension"])
-        return {
-            "file_size_kb": file_info.size / 1024 if file_info.size else 0,
-            "file_extension": file_info.extension.lower() if file_info.extension else "",
+        if file_info is None:
+            if access_token is None:
+                access_token = get_access_token(st.session_state.client)
+            file_info = get_file_info(file_id, access_token)
+        features = {
+            "file_size_kb": file_info["size"] / 1024 if file_info.get("size") else 0,
+            "file_extension": file_info["extension"].lower() if file_info.get("extension") else "",
             # Add more features like keyword extraction from content if needed
             "keyword_match_score": 0.0 # Placeholder
         }
+        if features_cache is not None:
+            features_cache[file_id] = (time.time(), features)
+        return dict(features)
     except Exception as e:
         logger.warning(f"Could not extract features for file {file_id}: {e}")
         return {
@@ -873,6 +1478,14 @@ def extract_document_features(file_id: str) -> Dict[str, Any]:
             "keyword_match_score": 0.0
         }
 
+def bust_feature_cache(file_id: str) -> None:
+    """
+    Drop cached features of a file from the session cache
+    """
+    features_cache = st.session_state.get("document_features_cache")
+    if features_cache is not None:
+        features_cache.pop(file_id, None)
+
 def calculate_multi_factor_confidence(ai_confidence: float, features: Dict[str, Any], category: str, reasoning: str, all_categories: List[str]) -> Dict[str, float]:
     """
     Calculate a multi-factor confidence score based on AI confidence, document features, and reasoning quality.
@@ -972,42 +1585,48 @@ def configure_confidence_thresholds():
     )
     
     # Update session state if changed
-    if (auto_accept != current_thresholds.get("auto_accept") or
-        verification != current_thresholds.get("verification") or
-        rejection != current_thresholds.get("rejection")):
-        st.session_state.confidence_thresholds = {
-            "auto_accept": auto_accept,
-            "verification": verification,
-            "rejection": rejection
-        }
+    new_thresholds = {
+        "auto_accept": auto_accept,
+        "verification": verification,
+        "rejection": rejection
+    }
+    if new_thresholds != current_thresholds:
+        st.session_state.confidence_thresholds = new_thresholds
         logger.info(f"Updated confidence thresholds: {st.session_state.confidence_thresholds}")
         # No rerun needed immediately, changes apply on next categorization or result display
 
 def apply_confidence_thresholds(results: Dict[str, Dict]) -> Dict[str, Dict]:
     """
     Apply status labels (Accepted, Review, Reject) based on confidence thresholds.
+    Statuses are computed for all results at once with NumPy and set in place.
     """
+    import numpy as np
+    
     thresholds = st.session_state.confidence_thresholds
-    updated_results = {}
+    if not results:
+        return results
     
-    for file_id, result in results.items():
-        confidence = result.get("calibrated_confidence", result.get("confidence", 0.0))
-        
-        if confidence >= thresholds["auto_accept"]:
-            result["status"] = "Accepted"
-        elif confidence >= thresholds["verification"]:
-            result["status"] = "Review"
-        else:
-            # Decide action below verification threshold (e.g., flag as low confidence or reject)
-            # For now, just mark as review needed
-            result["status"] = "Review (Low Confidence)"
-            # Optionally add a specific flag for rejection threshold if needed
-            # if confidence < thresholds["rejection"]:
-            #     result["status"] = "Rejected (Very Low Confidence)"
-        
-        updated_results[file_id] = result
+    confidences = np.fromiter(
+        (result.get("calibrated_confidence", result.get("confidence", 0.0)) for result in results.values()),
+        dtype=np.float64,
+        count=len(results)
+    )
+    # Below verification: for now, just mark as review needed
+    # (a separate "Rejected" status below thresholds["rejection"] could be added here)
+    statuses = np.select(
+        [confidences >= thresholds["auto_accept"], confidences >= thresholds["verification"]],
+        ["Accepted", "Review"],
+        default="Review (Low Confidence)"
+    )
+    
+    for result, status in zip(results.values(), statuses.tolist()):
+        result["status"] = status
         
-    return updated_results
+    return results
+
+# Overall confidence color by band: red below 0.6, yellow below 0.8, green from 0.8
+_CONFIDENCE_COLOR_BOUNDS = (0.6, 0.8)
+_CONFIDENCE_COLORS = ("#dc3545", "#ffc107", "#28a745")
 
 def display_confidence_visualization(confidence_data: Dict[str, float]):
     """
@@ -1019,15 +1638,21 @@ def display_confidence_visualization(confidence_data: Dict[str, float]):
     reasoning_factor = confidence_data.get("reasoning_factor", 0.0)
     
     # Determine overall color
-    if overall >= 0.8:
-        overall_color = "#28a745" # Green
-    elif overall >= 0.6:
-        overall_color = "#ffc107" # Yellow
-    else:
-        overall_color = "#dc3545" # Red
+    overall_color = _CONFIDENCE_COLORS[bisect.bisect_right(_CONFIDENCE_COLOR_BOUNDS, overall)]
         
     st.markdown(f"**Overall Confidence:** <span style='color: {overall_color}; font-weight: bold;'>{overall:.2f}</span>", unsafe_allow_html=True)
     
+    st.vega_lite_chart(_build_confidence_chart(ai_factor, feature_factor, reasoning_factor), use_container_width=True)
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def _build_confidence_chart(ai_factor: float, feature_factor: float, reasoning_factor: float) -> Dict[str, Any]:
+    """
+    Vega-Lite spec of the confidence factors bar chart. Cached by value, so reruns
+    and files with the same scores skip building the DataFrame and Altair chart.
+    """
+    import altair as alt
+    import pandas as pd
+    
     # Create data for Altair chart
     data = pd.DataFrame({
         'Factor': ['AI Confidence', 'Document Features', 'Reasoning Quality'],
@@ -1043,44 +1668,42 @@ def display_confidence_visualization(confidence_data: Dict[str, float]):
         title='Confidence Factors'
     )
     
-    st.altair_chart(chart, use_container_width=True)
+    return chart.to_dict()
+
+# Explanation sentence per confidence band: bisect_right(bounds, score) indexes the
+# templates (low, medium, high), so a score equal to a bound falls in the higher band
+_AI_FACTOR_EXPLANATIONS = ((0.6, 0.8), (
+    "- The AI model reported low confidence ({score:.2f}), suggesting some uncertainty.",
+    "- The AI model reported medium confidence ({score:.2f}).",
+    "- The AI model reported high confidence ({score:.2f}) in its initial assessment.",
+))
+_FEATURE_FACTOR_EXPLANATIONS = ((0.5, 0.7), (
+    "- Document features show low alignment ({score:.2f}) with typical '{category}' documents.",
+    "- Document features moderately align ({score:.2f}) with '{category}' documents.",
+    "- Document features (like file type, size) strongly align ({score:.2f}) with typical '{category}' documents.",
+))
+_REASONING_FACTOR_EXPLANATIONS = ((0.5, 0.7), (
+    "- The AI's reasoning lacked detail or specificity ({score:.2f}).",
+    "- The AI's reasoning was moderately detailed ({score:.2f}).",
+    "- The AI's reasoning was detailed and specific ({score:.2f}).",
+))
 
 def get_confidence_explanation(confidence_data: Dict[str, float], category: str) -> Dict[str, str]:
     """
     Generate human-readable explanations for the confidence score.
     """
     overall = confidence_data.get("overall", 0.0)
-    ai_factor = confidence_data.get("ai_confidence_factor", 0.0)
-    feature_factor = confidence_data.get("feature_factor", 0.0)
-    reasoning_factor = confidence_data.get("reasoning_factor", 0.0)
-    
-    explanation = f"The overall confidence score of {overall:.2f} for category '{category}' is based on several factors:"
     
-    # AI Confidence Explanation
-    if ai_factor >= 0.8:
-        explanation += f"\n- The AI model reported high confidence ({ai_factor:.2f}) in its initial assessment."
-    elif ai_factor >= 0.6:
-        explanation += f"\n- The AI model reported medium confidence ({ai_factor:.2f})."
-    else:
-        explanation += f"\n- The AI model reported low confidence ({ai_factor:.2f}), suggesting some uncertainty."
+    parts = [f"The overall confidence score of {overall:.2f} for category '{category}' is based on several factors:"]
+    for factor, (bounds, templates) in (
+        ("ai_confidence_factor", _AI_FACTOR_EXPLANATIONS),
+        ("feature_factor", _FEATURE_FACTOR_EXPLANATIONS),
+        ("reasoning_factor", _REASONING_FACTOR_EXPLANATIONS),
+    ):
+        score = confidence_data.get(factor, 0.0)
+        parts.append(templates[bisect.bisect_right(bounds, score)].format(score=score, category=category))
         
-    # Feature Factor Explanation
-    if feature_factor >= 0.7:
-        explanation += f"\n- Document features (like file type, size) strongly align ({feature_factor:.2f}) with typical '{category}' documents."
-    elif feature_factor >= 0.5:
-        explanation += f"\n- Document features moderately align ({feature_factor:.2f}) with '{category}' documents."
-    else:
-        explanation += f"\n- Document features show low alignment ({feature_factor:.2f}) with typical '{category}' documents."
-        
-    # Reasoning Quality Explanation
-    if reasoning_factor >= 0.7:
-        explanation += f"\n- The AI's reasoning was detailed and specific ({reasoning_factor:.2f})."
-    elif reasoning_factor >= 0.5:
-        explanation += f"\n- The AI's reasoning was moderately detailed ({reasoning_factor:.2f})."
-    else:
-        explanation += f"\n- The AI's reasoning lacked detail or specificity ({reasoning_factor:.2f})."
-        
-    return {"overall": explanation}
+    return {"overall": "\n".join(parts)}
 
 def validate_confidence_with_examples():
     """
@@ -1128,45 +1751,44 @@ def save_categorization_feedback(file_id: str, original_category: str, corrected
         "timestamp": datetime.datetime.now().isoformat()
     }
     logger.info(f"Saving feedback: {feedback_entry}")
+    # A correction often follows a re-upload; don't keep scoring against stale features
+    bust_feature_cache(file_id)
     # Placeholder: Append to a file or database
     # with open("categorization_feedback.jsonl", "a") as f:
     #     f.write(json.dumps(feedback_entry) + "\n")
     st.toast("Feedback saved for improving future categorizations.")
 
-def combine_categorization_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+def combine_categorization_results(results: List[CategorizationAnswer]) -> CategorizationAnswer:
     """
-    Combine results from multiple models using weighted voting or averaging.
-    Placeholder: Simple majority vote for now.
+    Combine results from multiple models using confidence-weighted voting.
+    The winning category is the one with the highest summed confidence; the combined
+    confidence is the average confidence of the models that chose it.
     """
     if not results:
         return {"document_type": "Other", "confidence": 0.0, "reasoning": "No results to combine"}
 
-    votes = {}
-    total_confidence = 0
-    combined_reasoning = "Combined Reasoning:\n"
-
+    scores = Counter()
     for result in results:
-        category = result.get("document_type", "Other")
-        confidence = result.get("confidence", 0.0)
-        reasoning = result.get("reasoning", "")
-        
-        votes[category] = votes.get(category, 0) + 1 # Simple count for majority
-        total_confidence += confidence # Simple sum for averaging later
-        combined_reasoning += f"- Model Result: {category} (Conf: {confidence:.2f})\n  Reasoning: {reasoning}\n"
-
-    # Determine winning category by majority vote
-    if votes:
-        winning_category = max(votes, key=votes.get)
-        # Calculate average confidence for the winning category (or overall average)
-        avg_confidence = total_confidence / len(results) if results else 0.0
-    else:
-        winning_category = "Other"
-        avg_confidence = 0.0
+        scores[result.get("document_type", "Other")] += result.get("confidence", 0.0)
+    winning_category = scores.most_common(1)[0][0]
+    
+    winning_confidences = [
+        result.get("confidence", 0.0) for result in results
+        if result.get("document_type", "Other") == winning_category
+    ]
+    avg_confidence = sum(winning_confidences) / len(winning_confidences)
+
+    reasoning_parts = ["Combined Reasoning:\n"]
+    reasoning_parts.extend(
+        f"- Model Result: {result.get('document_type', 'Other')} (Conf: {result.get('confidence', 0.0):.2f})\n"
+        f"  Reasoning: {result.get('reasoning', '')}\n"
+        for result in results
+    )
 
     return {
         "document_type": winning_category,
-        "confidence": avg_confidence, # Use average confidence
-        "reasoning": combined_reasoning
+        "confidence": avg_confidence,
+        "reasoning": "".join(reasoning_parts)
     }
 
 # --- Helper functions (like get_document_preview_url) would go here ---
@@ -378,7 +378,52 @@ def process_files_with_progress(files, extraction_functions, batch_size=5, proce
     st.session_state.processing_state["total_files"] = total_files
     
     # Process files
-    if processing_mode == "Parallel":
+    if (processing_mode == "Parallel"
+            and st.session_state.metadata_config["extraction_method"] == "structured"
+            and "extract_structured_metadata_batch" in extraction_functions):
+        # Structured extraction calls go through the batch helper, which runs the calls
+        # of a batch concurrently; results are stored and feedback applied per batch
+        processed_count = 0
+        for extraction_args, batch_files in group_structured_batches(files, batch_size):
+            # Check if processing was cancelled
+            if not st.session_state.processing_state.get("is_processing", False):
+                break
+            
+            # Update processing state
+            st.session_state.processing_state["current_file_index"] = processed_count
+            st.session_state.processing_state["current_file"] = ", ".join(file["name"] for file in batch_files)
+            
+            try:
+                batch_results = extraction_functions["extract_structured_metadata_batch"](
+                    [file["id"] for file in batch_files], max_workers=batch_size, **extraction_args
+                )
+            except Exception as e:
+                batch_results = {file["id"]: {"error": str(e)} for file in batch_files}
+            
+            for file in batch_files:
+                processed_count += 1
+                
+                try:
+                    # Process file with its batch result
+                    result = process_file(file, extraction_functions, batch_results.get(file["id"]))
+                    
+                    # Update processing state
+                    st.session_state.processing_state["processed_files"] += 1
+                    
+                    # Store result
+                    if result["success"]:
+                        st.session_state.processing_state["results"][file["id"]] = result["data"]
+                        st.session_state.extraction_results[file["id"]] = result["data"]
+                    else:
+                        st.session_state.processing_state["errors"][file["id"]] = result["error"]
+                
+                except Exception as e:
+                    # Update processing state
+                    st.session_state.processing_state["processed_files"] += 1
+                    
+                    # Store error
+                    st.session_state.processing_state["errors"][file["id"]] = str(e)
+    elif processing_mode == "Parallel":
         # Process files in parallel
         with concurrent.futures.ThreadPoolExecutor(max_workers=batch_size) as executor:
             # Submit tasks
@@ -471,13 +516,94 @@ def get_document_type_for_file(file_id):
     
     return None
 
-def process_file(file, extraction_functions):
+def get_structured_extraction_args(document_type):
+    """
+    Get the keyword arguments for structured extraction of a file
+    
+    Args:
+        document_type: Document type of the file, or None if not categorized
+        
+    Returns:
+        dict: metadata_template (for template extraction) or fields, and ai_model
+    """
+    if not st.session_state.metadata_config["use_template"]:
+        return {
+            "fields": st.session_state.metadata_config["custom_fields"],
+            "ai_model": st.session_state.metadata_config["ai_model"]
+        }
+    
+    # Get template ID based on document type if available
+    template_id = None
+    
+    # Check if we have a document type and a mapping for it
+    if document_type and hasattr(st.session_state, "document_type_to_template"):
+        mapped_template_id = st.session_state.document_type_to_template.get(document_type)
+        if mapped_template_id:
+            template_id = mapped_template_id
+            logger.info(f"Using document type specific template for {document_type}: {template_id}")
+    
+    # If no document type specific template, use the general one
+    if not template_id:
+        template_id = st.session_state.metadata_config["template_id"]
+        logger.info(f"Using general template: {template_id}")
+    
+    # Parse the template ID to extract the correct components
+    # Format is typically: scope_id_templateKey (e.g., enterprise_336904155_financialReport)
+    parts = template_id.split('_')
+    
+    # Extract the scope and enterprise ID
+    scope = parts[0]  # e.g., "enterprise"
+    enterprise_id = parts[1] if len(parts) > 1 else ""
+    
+    # Extract the actual template key (last part)
+    template_key = parts[-1] if len(parts) > 2 else template_id
+    
+    # Create metadata template reference with correct format according to Box API documentation
+    metadata_template = {
+        "template_key": template_key,
+        "type": "metadata_template",
+        "scope": f"{scope}_{enterprise_id}"
+    }
+    
+    logger.info(f"Using template-based extraction with template ID: {template_id}")
+    return {
+        "metadata_template": metadata_template,
+        "ai_model": st.session_state.metadata_config["ai_model"]
+    }
+
+def group_structured_batches(files, batch_size):
+    """
+    Split files into batches for extract_structured_metadata_batch: files sharing a
+    template (or set of custom fields) are grouped, and each group is cut into batches
+    of at most batch_size files, so progress and cancellation are checked per batch
+    
+    Args:
+        files: List of files to process
+        batch_size: Maximum number of files per batch
+        
+    Yields:
+        tuple: (extraction arguments, list of files in the batch)
+    """
+    # Group files by their extraction arguments
+    groups = {}
+    for file in files:
+        extraction_args = get_structured_extraction_args(get_document_type_for_file(file["id"]))
+        group_key = json.dumps(extraction_args, sort_keys=True, default=str)
+        groups.setdefault(group_key, (extraction_args, []))[1].append(file)
+    
+    for extraction_args, group_files in groups.values():
+        for start in range(0, len(group_files), batch_size):
+            yield extraction_args, group_files[start:start + batch_size]
+
+def process_file(file, extraction_functions, prefetched_result=None):
     """
     Process a single file
     
     Args:
         file: File to process
         extraction_functions: Dictionary of extraction functions
+        prefetched_result: Structured extraction result from extract_structured_metadata_batch;
+            if given, the file is not extracted again
         
     Returns:
         dict: Processing result
@@ -502,91 +628,32 @@ def process_file(file, extraction_functions):
         
         # Determine extraction method
         if st.session_state.metadata_config["extraction_method"] == "structured":
-            # Structured extraction
-            if st.session_state.metadata_config["use_template"]:
-                # Get template ID based on document type if available
-                template_id = None
-                
-                # Check if we have a document type and a mapping for it
-                if document_type and hasattr(st.session_state, "document_type_to_template"):
-                    mapped_template_id = st.session_state.document_type_to_template.get(document_type)
-                    if mapped_template_id:
-                        template_id = mapped_template_id
-                        logger.info(f"Using document type specific template for {document_type}: {template_id}")
-                
-                # If no document type specific template, use the general one
-                if not template_id:
-                    template_id = st.session_state.metadata_config["template_id"]
-                    logger.info(f"Using general template: {template_id}")
-                
-                # Parse the template ID to extract the correct components
-                # Format is typically: scope_id_templateKey (e.g., enterprise_336904155_financialReport)
-                parts = template_id.split('_')
-                
-                # Extract the scope and enterprise ID
-                scope = parts[0]  # e.g., "enterprise"
-                enterprise_id = parts[1] if len(parts) > 1 else ""
-                
-                # Extract the actual template key (last part)
-                template_key = parts[-1] if len(parts) > 2 else template_id
-                
-                # Create metadata template reference with correct format according to Box API documentation
-                metadata_template = {
-                    "template_key": template_key,
-                    "type": "metadata_template",
-                    "scope": f"{scope}_{enterprise_id}"
-                }
-                
-                logger.info(f"Using template-based extraction with template ID: {template_id}")
-                
-                # Use real API call
-                api_result = extraction_functions["extract_structured_metadata"](
-                    file_id=file_id,
-                    metadata_template=metadata_template,
-                    ai_model=st.session_state.metadata_config["ai_model"]
-                )
-                
-                # Create a clean result object with the extracted data
-                result = {}
-                
-                # Copy fields from API result to our result object
-                if isinstance(api_result, dict):
-                    for key, value in api_result.items():
-                        if key not in ["error", "items", "response"]:
-                            result[key] = value
-                
-                # Apply feedback if available
-                if has_feedback:
-                    feedback = st.session_state.feedback_data[feedback_key]
-                    # Merge feedback with result, prioritizing feedback
-                    for key, value in feedback.items():
-                        result[key] = value
+            # Structured extraction with a template or custom fields
+            extraction_args = get_structured_extraction_args(document_type)
+            if "fields" in extraction_args:
+                logger.info(f"Using custom fields extraction with {len(extraction_args['fields'])} fields")
+            
+            # Use real API call, unless the result was already fetched in a batch
+            if prefetched_result is not None:
+                api_result = prefetched_result
             else:
-                # Custom fields extraction
-                logger.info(f"Using custom fields extraction with {len(st.session_state.metadata_config['custom_fields'])} fields")
-                
-                # Use real API call
-                api_result = extraction_functions["extract_structured_metadata"](
-                    file_id=file_id,
-                    fields=st.session_state.metadata_config["custom_fields"],
-                    ai_model=st.session_state.metadata_config["ai_model"]
-                )
-                
-                # Create a clean result object with the extracted data
-                result = {}
-                
-                # Copy fields from API result to our result object
-                if isinstance(api_result, dict):
-                    for key, value in api_result.items():
-                        if key not in ["error", "items", "response"]:
-                            result[key] = value
-                
-                # Apply feedback if available
-                if has_feedback:
-                    feedback = st.session_state.feedback_data[feedback_key]
-                    # Merge feedback with result, prioritizing feedback
-                    for key, value in feedback.items():
+                api_result = extraction_functions["extract_structured_metadata"](file_id=file_id, **extraction_args)
+            
+            # Create a clean result object with the extracted data
+            result = {}
+            
+            # Copy fields from API result to our result object
+            if isinstance(api_result, dict):
+                for key, value in api_result.items():
+                    if key not in ["error", "items", "response"]:
                         result[key] = value
+            
+            # Apply feedback if available
+            if has_feedback:
+                feedback = st.session_state.feedback_data[feedback_key]
+                # Merge feedback with result, prioritizing feedback
+                for key, value in feedback.items():
+                    result[key] = value
         else:
             # Freeform extraction
             # Get prompt based on document type if available
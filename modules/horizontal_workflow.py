@@ -1,58 +1,161 @@
 import streamlit as st
 import logging
+from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True)
+class WorkflowStep:
+    """One step of the workflow indicator"""
+    __slots__ = ("id", "title", "page")
+    id: str
+    title: str
+    page: str
+
 # Define the workflow steps (centralized definition)
-workflow_steps = [
-    {
-        "id": "authentication",
-        "title": "Login",
-        "page": "Home",
-        "icon": "🔑" # Icon might be hard to fit nicely in chevrons
-    },
-    {
-        "id": "file_browser",
-        "title": "Select Files",
-        "page": "File Browser",
-        "icon": "📁"
-    },
-    {
-        "id": "document_categorization",
-        "title": "Categorize",
-        "page": "Document Categorization",
-        "icon": "🏷️"
-    },
-    {
-        "id": "metadata_config",
-        "title": "Configure",
-        "page": "Metadata Configuration",
-        "icon": "⚙️"
-    },
-    {
-        "id": "process_files",
-        "title": "Process",
-        "page": "Process Files",
-        "icon": "🔄"
-    },
-    {
-        "id": "view_results",
-        "title": "Review",
-        "page": "View Results",
-        "icon": "👁️"
-    },
-    {
-        "id": "apply_metadata",
-        "title": "Apply",
-        "page": "Apply Metadata",
-        "icon": "✅"
+workflow_steps = (
+    WorkflowStep(id="authentication", title="Login", page="Home"),
+    WorkflowStep(id="file_browser", title="Select Files", page="File Browser"),
+    WorkflowStep(id="document_categorization", title="Categorize", page="Document Categorization"),
+    WorkflowStep(id="metadata_config", title="Configure", page="Metadata Configuration"),
+    WorkflowStep(id="process_files", title="Process", page="Process Files"),
+    WorkflowStep(id="view_results", title="Review", page="View Results"),
+    WorkflowStep(id="apply_metadata", title="Apply", page="Apply Metadata")
+)
+
+# Step fields used for rendering, as parallel tuples indexed by step number
+_TITLES = tuple(step.title for step in workflow_steps)
+_PAGES = tuple(step.page for step in workflow_steps)
+_STEP_LABELS = tuple(f"Step {i + 1}" for i in range(len(workflow_steps)))
+
+# Step index of each page, for looking up the current step
+_PAGE_INDEX = {page: i for i, page in enumerate(_PAGES)}
+
+# Markup of all steps, identical for every page: which steps show as completed or
+# current is decided by CSS from the container's data-current attribute
+_STEP_TEMPLATE = '<div class="chevron-step" title="{title} ({label})">{title}<span class="chevron-check"> ✓</span></div>'
+_STEPS_HTML = "".join(_STEP_TEMPLATE.format(title=title, label=label) for title, label in zip(_TITLES, _STEP_LABELS))
+
+# CSS for the chevron strip
+_CHEVRON_CSS = """
+<style>
+    .chevron-container {
+        display: flex;
+        justify-content: center; /* Center the chevrons */
+        list-style: none;
+        padding: 0;
+        margin: 20px 0; /* Add some margin */
+        width: 100%;
+        overflow-x: auto; /* Allow horizontal scrolling if needed */
+    }
+    .chevron-step {
+        background-color: #e9ecef; /* Default upcoming background */
+        color: #6c757d; /* Default upcoming text */
+        padding: 0.5rem 1rem 0.5rem 2rem; /* Adjust padding */
+        margin-right: -1rem; /* Overlap chevrons */
+        position: relative;
+        text-align: center;
+        min-width: 120px; /* Minimum width for each step */
+        white-space: nowrap;
+        border: 1px solid #ced4da;
+        cursor: default; /* Default cursor - not clickable */
+    }
+    .chevron-step::before, .chevron-step::after {
+        content: "";
+        position: absolute;
+        top: 0;
+        border: 0 solid transparent;
+        border-width: 1.55rem 1rem; /* Controls size/angle of arrow */
+        width: 0;
+        height: 0;
+    }
+    .chevron-step::before {
+        left: -0.05rem; /* Position left arrow */
+        border-left-color: white; /* Match page background */
+        border-left-width: 1rem;
+    }
+    .chevron-step::after {
+        left: 100%;
+        z-index: 2;
+        border-left-color: #e9ecef; /* Match step background */
+    }
+    /* First step doesn't need the left cutout */
+    .chevron-step:first-child {
+        padding-left: 1rem;
+        border-top-left-radius: 5px;
+        border-bottom-left-radius: 5px;
+    }
+    .chevron-step:first-child::before {
+        display: none;
+    }
+    /* Last step doesn't need the right arrow */
+    .chevron-step:last-child {
+        margin-right: 0;
+        padding-right: 1rem;
+        border-top-right-radius: 5px;
+        border-bottom-right-radius: 5px;
+    }
+    .chevron-step:last-child::after {
+        display: none;
+    }
+
+    /* Checkmark, shown on completed steps only */
+    .chevron-check {
+        display: none;
     }
-]
+
+    /* Completed and current step styling: one rule per possible current step (below) */
+
+    /* Removed link styling as it's not interactive */
+    /* .chevron-step a { ... } */
+
+{status_rules}
+</style>
+"""
+
+_COMPLETED_STEP_STYLE = (
+    "background-color: #cfe2ff; color: #052c65; border-color: #9ec5fe;"  # Light blue background, dark blue text
+)
+_COMPLETED_ARROW_STYLE = "border-left-color: #cfe2ff;"  # Match completed background
+_CURRENT_STEP_STYLE = (
+    "background-color: #0d6efd; color: white; font-weight: bold; "
+    "z-index: 3; border-color: #0a58ca;"  # Blue background; current step overlaps others
+)
+_CURRENT_ARROW_STYLE = "border-left-color: #0d6efd;"  # Match current background
+
+def _status_rules(step_count: int) -> str:
+    """
+    CSS styling the steps before data-current as completed and step data-current as current.
+    """
+    rules = []
+    for current in range(1, step_count + 1):
+        container = f'.chevron-container[data-current="{current}"] > .chevron-step'
+        if current > 1:
+            completed = f"{container}:nth-child(-n+{current - 1})"
+            rules.append(f"    {completed} {{ {_COMPLETED_STEP_STYLE} }}")
+            rules.append(f"    {completed}::after {{ {_COMPLETED_ARROW_STYLE} }}")
+            rules.append(f"    {completed} .chevron-check {{ display: inline; }}")
+        rules.append(f"    {container}:nth-child({current}) {{ {_CURRENT_STEP_STYLE} }}")
+        rules.append(f"    {container}:nth-child({current})::after {{ {_CURRENT_ARROW_STYLE} }}")
+    return "\n".join(rules)
+
+_CHEVRON_CSS = _CHEVRON_CSS.replace("{status_rules}", _status_rules(len(_TITLES)))
 
 # Removed navigate_to_step function as navigation is handled by sidebar now
 # def navigate_to_step(page_id):
 #     ...
 
+def _build_chevrons_html(current_step_index: int) -> str:
+    """
+    HTML of the chevron strip with the given step current (-1 for none).
+    """
+    return f'<div class="chevron-container" data-current="{current_step_index + 1}">{_STEPS_HTML}</div>'
+
+# The strip only depends on the current page, so render it (with its styles, sent as
+# one markdown element) once per page up front
+_CHEVRONS_HTML = {page: _CHEVRON_CSS + _build_chevrons_html(i) for page, i in _PAGE_INDEX.items()}
+_CHEVRONS_HTML_NO_STEP = _CHEVRON_CSS + _build_chevrons_html(-1)
+
 def display_horizontal_workflow(current_page_id: str):
     """
     Displays the horizontal workflow indicator using Salesforce-style chevrons.
@@ -61,142 +164,11 @@ def display_horizontal_workflow(current_page_id: str):
     Args:
         current_page_id: The page ID of the current step (e.g., "Home", "File Browser").
     """
-    
-    # Find the index of the current step
-    current_step_index = -1
-    for i, step in enumerate(workflow_steps):
-        if step["page"] == current_page_id:
-            current_step_index = i
-            break
-            
-    # Inject CSS for chevron styling
-    css = """
-    <style>
-        .chevron-container {
-            display: flex;
-            justify-content: center; /* Center the chevrons */
-            list-style: none;
-            padding: 0;
-            margin: 20px 0; /* Add some margin */
-            width: 100%;
-            overflow-x: auto; /* Allow horizontal scrolling if needed */
-        }
-        .chevron-step {
-            background-color: #e9ecef; /* Default upcoming background */
-            color: #6c757d; /* Default upcoming text */
-            padding: 0.5rem 1rem 0.5rem 2rem; /* Adjust padding */
-            margin-right: -1rem; /* Overlap chevrons */
-            position: relative;
-            text-align: center;
-            min-width: 120px; /* Minimum width for each step */
-            white-space: nowrap;
-            border: 1px solid #ced4da;
-            cursor: default; /* Default cursor - not clickable */
-        }
-        .chevron-step::before, .chevron-step::after {
-            content: "";
-            position: absolute;
-            top: 0;
-            border: 0 solid transparent;
-            border-width: 1.55rem 1rem; /* Controls size/angle of arrow */
-            width: 0;
-            height: 0;
-        }
-        .chevron-step::before {
-            left: -0.05rem; /* Position left arrow */
-            border-left-color: white; /* Match page background */
-            border-left-width: 1rem;
-        }
-        .chevron-step::after {
-            left: 100%;
-            z-index: 2;
-            border-left-color: #e9ecef; /* Match step background */
-        }
-        /* First step doesn't need the left cutout */
-        .chevron-step:first-child {
-            padding-left: 1rem;
-            border-top-left-radius: 5px;
-            border-bottom-left-radius: 5px;
-        }
-        .chevron-step:first-child::before {
-            display: none;
-        }
-        /* Last step doesn't need the right arrow */
-        .chevron-step:last-child {
-            margin-right: 0;
-            padding-right: 1rem;
-            border-top-right-radius: 5px;
-            border-bottom-right-radius: 5px;
-        }
-        .chevron-step:last-child::after {
-            display: none;
-        }
-
-        /* Completed Step Styling */
-        .chevron-step-completed {
-            background-color: #cfe2ff; /* Light blue background */
-            color: #052c65; /* Dark blue text */
-            border-color: #9ec5fe;
-            /* cursor: pointer; Removed - not clickable */
-        }
-        .chevron-step-completed::after {
-            border-left-color: #cfe2ff; /* Match completed background */
-        }
-        /* Removed hover styles as it's not interactive */
-        /* .chevron-step-completed:hover { ... } */
-        /* .chevron-step-completed:hover::after { ... } */
-
-        /* Current Step Styling */
-        .chevron-step-current {
-            background-color: #0d6efd; /* Blue background */
-            color: white;
-            font-weight: bold;
-            z-index: 3; /* Ensure current step overlaps others */
-            border-color: #0a58ca;
-        }
-        .chevron-step-current::after {
-            border-left-color: #0d6efd; /* Match current background */
-        }
-        
-        /* Removed link styling as it's not interactive */
-        /* .chevron-step a { ... } */
-
-    </style>
-    """
-    st.markdown(css, unsafe_allow_html=True)
-
-    # Generate HTML for the chevrons
-    html_content = "<div class=\"chevron-container\">"
-    
-    for i, step in enumerate(workflow_steps):
-        # Determine CSS class based on status
-        status_class = ""
-        if i < current_step_index:
-            status_class = "chevron-step-completed"
-        elif i == current_step_index:
-            status_class = "chevron-step-current"
-        else:
-            status_class = "chevron-step-upcoming" # Default class defined above
-
-        step_html = f"<div class=\"chevron-step {status_class}\" "
-        step_html += f" title=\"{step['title']} (Step {i+1})\">" # Add step number to title
-        
-        # Display title
-        step_html += f"{step['title']}"
-        # Add checkmark for completed steps
-        if i < current_step_index:
-             step_html += " ✓"
-             
-        step_html += "</div>"
-        html_content += step_html
-        
-    html_content += "</div>"
-    
-    # Render the visual chevrons
-    st.markdown(html_content, unsafe_allow_html=True)
+    # Render the styled chevrons for the current page (pages outside the workflow have no
+    # current step). Streamlit drops elements that a rerun doesn't emit again, so the
+    # styles go out with every render, in the same element as the strip.
+    st.markdown(_CHEVRONS_HTML.get(current_page_id, _CHEVRONS_HTML_NO_STEP), unsafe_allow_html=True)
 
     # --- REMOVED Click Handling Section --- 
     # The st.columns and st.button logic previously here has been removed.
     # Navigation is now handled by the sidebar buttons in app.py.
-
-
@@ -1,6 +1,5 @@
 import streamlit as st
 import logging
-import json
 from typing import Dict, Any, List, Optional
 
 # Configure logging
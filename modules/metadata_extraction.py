@@ -1,14 +1,578 @@
 import streamlit as st
 import logging
 import json
-import requests
-from typing import Dict, Any, List, Optional
+import os
+import hashlib
+import functools
+import threading
+import concurrent.futures
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from modules.box_ai import (
+    BOX_AI_TIMEOUT, TTLCache, box_ai_headers, caller_id, file_version_id, get_access_token, get_file_info,
+    http_session, json_dumps, json_loads
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Box AI endpoints for structured and freeform extraction
+STRUCTURED_EXTRACT_URL = "https://api.box.com/2.0/ai/extract_structured"
+FREEFORM_EXTRACT_URL = "https://api.box.com/2.0/ai/extract"
+
+# System messages asking Box AI for a value and a confidence level for each field
+STRUCTURED_SYSTEM_MESSAGE = "You are an AI assistant specialized in extracting metadata from documents based on provided field definitions. For each field, analyze the document content and extract the corresponding value. CRITICALLY IMPORTANT: Respond for EACH field with a JSON object containing two keys: 1. \\\"value\\\": The extracted metadata value as a string. 2. \\\"confidence\\\": Your confidence level for this specific extraction, chosen from ONLY these three options: \\\"High\\\", \\\"Medium\\\", or \\\"Low\\\". Base your confidence on how certain you are about the extracted value given the document content and field definition. Example Response for a field: {\\\"value\\\": \\\"INV-12345\\\", \\\"confidence\\\": \\\"High\\\"}"
+FREEFORM_SYSTEM_MESSAGE = "You are an AI assistant specialized in extracting metadata from documents. Extract the requested information and for EACH extracted field, provide both the value and your confidence level (High, Medium, or Low). Format your response as a JSON object where each field has a nested object containing \\\"value\\\" and \\\"confidence\\\" keys. Example: {\\\"InvoiceNumber\\\": {\\\"value\\\": \\\"INV-12345\\\", \\\"confidence\\\": \\\"High\\\"}, \\\"Date\\\": {\\\"value\\\": \\\"2023-04-15\\\", \\\"confidence\\\": \\\"Medium\\\"}}"
+
+# Bytes of a Box AI error response body to include in the log
+ERROR_BODY_LOG_LIMIT = 2048
+
+# Decoder for the first JSON object in an answer when its '{' ... '}' span does not parse
+_JSON_DECODER = json.JSONDecoder()
+
+# Confidence levels Box AI is asked to choose from
+_VALID_CONFIDENCE = frozenset(("High", "Medium", "Low"))
+
+# Upper bound on files extracted concurrently by extract_structured_metadata_batch
+MAX_EXTRACTION_WORKERS = 16
+
+# In-process LRU of processed extraction results keyed on template or fields (or prompt)
+# and model, caller, file and file version, so reruns and retries of the same extraction
+# skip Box AI. The TTL (seconds) can be tuned with the BOX_AI_CACHE_TTL environment
+# variable; 0 disables it.
+BOX_AI_CACHE_TTL = int(os.getenv("BOX_AI_CACHE_TTL", "900"))
+EXTRACTION_CACHE_MAX_ENTRIES = 4096
+_extraction_cache = TTLCache(BOX_AI_CACHE_TTL, EXTRACTION_CACHE_MAX_ENTRIES)
+
+# Extractions in flight, keyed like the result cache (so per caller and file version).
+# Identical requests from the same caller made while one is running (reruns, repeated
+# clicks) wait for it instead of calling Box AI; other sessions never share its result.
+_inflight: Dict[str, concurrent.futures.Future] = {}
+_inflight_lock = threading.Lock()
+
+def _extraction_spec_digest(**spec: Any) -> str:
+    """
+    Digest of what an extraction asks for (template or fields or prompt, and model),
+    computed once and combined with each file by _extraction_cache_key
+    """
+    return hashlib.blake2b(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _extraction_cache_key(file_id: str, spec_digest: str, access_token: str) -> Optional[str]:
+    """
+    Result cache key for one file: extraction spec, caller, file and its current version,
+    so a new file version misses the cache and one session's results are never returned
+    to another. Returns None (no caching) if the file version cannot be determined.
+    """
+    try:
+        version_id = file_version_id(get_file_info(file_id, access_token))
+    except Exception as e:
+        logger.warning("Could not determine file version for %s, extraction will not be cached: %s", file_id, e)
+        return None
+    if version_id is None:
+        logger.warning("No file version for %s, extraction will not be cached", file_id)
+        return None
+    return f"{spec_digest}:{caller_id(access_token)}:{file_id}:{version_id}"
+
+def _single_flight(key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Run compute() for key, unless a call for the same key is already in flight; then
+    wait for that call and share its result (or exception) instead of repeating it.
+    key must come from _extraction_cache_key, which scopes it to the caller.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = concurrent.futures.Future()
+            _inflight[key] = future
+    
+    if not leader:
+        return dict(future.result())
+    
+    try:
+        result = compute()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+def _extraction_cache_set(key: Optional[str], result: Dict[str, Any]) -> None:
+    """
+    Store a result, evicting the least recently used entries beyond EXTRACTION_CACHE_MAX_ENTRIES.
+    Error results, and results without a cache key, are not cached.
+    """
+    if key is None or BOX_AI_CACHE_TTL <= 0 or "error" in result:
+        return
+    _extraction_cache.set(key, result)
+
+@functools.lru_cache(maxsize=16)
+def _structured_ai_agent(ai_model: str) -> Dict[str, Any]:
+    """
+    AI agent configuration for structured extraction, with confidence scoring
+    instructions, built once per model. The dict is shared between requests, so
+    callers must not modify it.
+    """
+    return {
+        "type": "ai_agent_extract_structured",
+        "long_text": {
+            "model": ai_model,
+            "mode": "default",
+            "system_message": STRUCTURED_SYSTEM_MESSAGE
+        },
+        "basic_text": {
+            "model": ai_model,
+            "mode": "default",
+            "system_message": STRUCTURED_SYSTEM_MESSAGE
+        }
+    }
+
+@functools.lru_cache(maxsize=16)
+def _freeform_ai_agent(ai_model: str) -> Dict[str, Any]:
+    """
+    AI agent configuration for freeform extraction, with confidence scoring
+    instructions, built once per model. The dict is shared between requests, so
+    callers must not modify it.
+    """
+    return {
+        "type": "ai_agent_extract",
+        "long_text": {
+            "model": ai_model,
+            "system_message": FREEFORM_SYSTEM_MESSAGE
+        },
+        "basic_text": {
+            "model": ai_model,
+            "system_message": FREEFORM_SYSTEM_MESSAGE
+        }
+    }
+
+def _to_box_field(field: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a custom field definition to the Box API field format.
+    Fields that already have a "key" are in Box API format and returned as they are.
+    """
+    if "key" in field:
+        return field
+    
+    name = field.get("name", "")
+    field_type = field.get("type", "string")
+    api_field = {
+        "key": name,
+        "displayName": field.get("display_name", name),
+        "type": field_type
+    }
+    
+    # Add description and prompt if available
+    if "description" in field:
+        api_field["description"] = field["description"]
+    if "prompt" in field:
+        api_field["prompt"] = field["prompt"]
+    
+    # Add options for enum fields
+    if field_type == "enum" and "options" in field:
+        api_field["options"] = field["options"]
+    
+    return api_field
+
+def _build_structured_body_template(fields: Optional[List[Dict[str, Any]]] = None,
+                                    metadata_template: Optional[Dict[str, Any]] = None,
+                                    ai_model: str = "azure__openai__gpt_4o_mini") -> Dict[str, Any]:
+    """
+    Build the structured extraction request body without its "items", so one body
+    can be shared by every file extracted with the same template or fields
+    
+    Raises:
+        ValueError: If neither fields nor metadata_template is provided
+    """
+    # Construct request body
+    request_body = {"ai_agent": _structured_ai_agent(ai_model)}
+    
+    # Add template or fields
+    if metadata_template:
+        request_body["metadata_template"] = metadata_template
+    elif fields:
+        # Convert fields to Box API format if needed
+        request_body["fields"] = [_to_box_field(field) for field in fields]
+    else:
+        raise ValueError("Either fields or metadata_template must be provided")
+    
+    return request_body
+
+def _parse_embedded_json(response_text: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Parse the JSON object spanning the first '{' to the last '}' of a Box AI answer.
+    The decoder only runs when such a span exists; a span that parses is always an object.
+    An answer that is only the object (and whitespace) is decoded without copying it.
+    If the span does not parse, e.g. because prose after the object contains a '}',
+    the first complete object starting at the first '{' is used instead.
+    
+    Args:
+        response_text: Answer text that may embed a JSON object
+        
+    Returns:
+        tuple: (parsed object, None), or (None, reason) where reason is "not_text",
+        "no_json" or "decode_error (<decoder message>)"
+    """
+    if not isinstance(response_text, str):
+        return None, "not_text"
+    json_start = response_text.find('{')
+    json_end = response_text.rfind('}') + 1
+    if json_start == -1 or json_end <= json_start:
+        return None, "no_json"
+    # Nothing but whitespace around the object: decode the answer as it is
+    only_json = ((json_start == 0 or response_text[:json_start].isspace())
+                 and (json_end == len(response_text) or response_text[json_end:].isspace()))
+    json_text = response_text if only_json else response_text[json_start:json_end]
+    try:
+        return json_loads(json_text), None
+    except json.JSONDecodeError:
+        pass
+    try:
+        return _JSON_DECODER.raw_decode(response_text, json_start)[0], None
+    except json.JSONDecodeError as e:
+        return None, f"decode_error ({e})"
+
+def _normalize_confidence(confidence_level: Any, field_key: str) -> str:
+    """
+    Return a confidence level Box AI was asked for, or "Medium" (with a warning) for anything else
+    """
+    if isinstance(confidence_level, str) and confidence_level in _VALID_CONFIDENCE:
+        return confidence_level
+    logger.warning("Field %s: Unexpected confidence value '%s', defaulting to Medium.", field_key, confidence_level)
+    return "Medium"
+
+def _coerce_field(field_key: str, field_data: Any) -> Tuple[Any, str]:
+    """
+    Value and confidence level for one field of a key-value answer
+    """
+    # A dictionary with 'value' and, normally, 'confidence'
+    if isinstance(field_data, dict) and "value" in field_data:
+        confidence_level = field_data.get("confidence")
+        if confidence_level is None:
+            # Default confidence as it was missing
+            logger.warning("Field %s: Found dict without 'confidence' key: %s. Extracting value directly.", field_key, field_data)
+            return field_data["value"], "Medium"
+        return field_data["value"], _normalize_confidence(confidence_level, field_key)
+    
+    # A null value
+    if field_data is None:
+        logger.info(f"Field {field_key}: Received null value. Setting value to None and confidence to Low.")
+        return None, "Low"
+    
+    # Otherwise treat the whole field_data as the value
+    logger.warning("Field %s: Unexpected data format: %s. Using raw data as value and Medium confidence.", field_key, field_data)
+    return field_data, "Medium"
+
+def _process_key_value_answer(answer_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flatten a key-value answer into field values and '<field>_confidence' entries
+    """
+    processed_response = {}
+    for field_key, field_data in answer_dict.items():
+        try:
+            extracted_value, confidence_level = _coerce_field(field_key, field_data)
+            processed_response[field_key] = extracted_value
+            processed_response[field_key + "_confidence"] = confidence_level
+        except Exception as e:
+            logger.error(f"Error processing field {field_key} with data '{field_data}': {str(e)}")
+            processed_response[field_key] = field_data # Store original data on error
+            processed_response[field_key + "_confidence"] = "Low" # Low confidence due to processing error
+    return processed_response
+
+def _process_answer_fields(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process an 'answer' dictionary holding a 'fields' array of key/value/confidence items
+    """
+    logger.info("Processing 'answer' with 'fields' array format.")
+    processed_response = {}
+    for field_item in response_data["answer"]["fields"]:
+        if isinstance(field_item, dict) and "key" in field_item and "value" in field_item:
+            field_key = field_item["key"]
+            # Get confidence if available, otherwise default to Medium
+            confidence_level = _normalize_confidence(field_item.get("confidence", "Medium"), field_key)
+            processed_response[field_key] = field_item["value"]
+            # Item keys are JSON values rather than object keys, so may not be strings
+            processed_response[str(field_key) + "_confidence"] = confidence_level
+        else:
+            logger.warning("Skipping invalid item in 'fields' array: %s", field_item)
+    return processed_response
+
+def _process_answer_dict(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process an 'answer' dictionary of field keys to values
+    """
+    logger.info("Processing 'answer' as standard key-value dictionary.")
+    return _process_key_value_answer(response_data["answer"])
+
+def _process_answer_str(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process an 'answer' string, which may embed a JSON object of fields
+    """
+    logger.info("Processing 'answer' as string (potential freeform JSON).")
+    response_text = response_data["answer"]
+    parsed_json, parse_error = _parse_embedded_json(response_text)
+    if parsed_json is not None:
+        return _process_key_value_answer(parsed_json)
+    
+    # Not a JSON object, store raw text
+    logger.warning("No JSON object parsed from 'answer' string: %s", parse_error)
+    return {"_raw_response": response_text, "_confidence_processing_failed": True}
+
+def _process_entries(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process the 'entries' format of older API responses (for backward compatibility)
+    """
+    logger.info("Processing response using fallback 'entries' format.")
+    # Get the first entry (should be our file)
+    entry = response_data["entries"][0]
+    
+    # Check if we have metadata fields
+    if "metadata" not in entry:
+        logger.warning("No 'metadata' field found in the structured API entry: %s", entry)
+        return {"_error": "No 'metadata' field in API entry", "_confidence_processing_failed": True}
+    
+    processed_response = {}
+    # Process each field to extract value and confidence
+    for field_key, field_value in entry["metadata"].items():
+        # Default values
+        extracted_value = field_value
+        confidence_level = "Medium" # Default if parsing fails or not provided
+
+        try:
+            # Check if field_value is a string that looks like our requested JSON
+            if isinstance(field_value, str) and field_value.strip().startswith('{') and field_value.strip().endswith('}'):
+                try:
+                    # Attempt to parse as JSON
+                    parsed_value = json_loads(field_value)
+                    if isinstance(parsed_value, dict) and "value" in parsed_value and "confidence" in parsed_value:
+                        # Successfully parsed the expected JSON structure
+                        extracted_value = parsed_value["value"]
+                        confidence_level = _normalize_confidence(parsed_value["confidence"], field_key)
+                    else:
+                        # Parsed JSON but not the expected structure
+                        logger.warning("Field %s: Parsed JSON but keys 'value' and 'confidence' not found. Using raw value.", field_key)
+                except json.JSONDecodeError:
+                    # String looked like JSON but failed to parse
+                    logger.warning("Field %s: Failed to parse potential JSON value '%s'. Using raw value.", field_key, field_value)
+            else:
+                # field_value is not a string or doesn't look like JSON, so assume the value
+                # is the direct extraction result with the default confidence
+                logger.info(f"Field {field_key}: Value is not the expected JSON format. Using raw value and Medium confidence.")
+
+            # Store the extracted value and confidence
+            processed_response[field_key] = extracted_value
+            processed_response[field_key + "_confidence"] = confidence_level
+
+        except Exception as e:
+            logger.error(f"Error processing field {field_key} with value '{field_value}': {str(e)}")
+            processed_response[field_key] = field_value # Store original value on error
+            processed_response[field_key + "_confidence"] = "Low" # Low confidence due to processing error
+    return processed_response
+
+def _process_unrecognized(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Error result for a response with neither 'answer' nor 'entries'
+    """
+    logger.warning("Neither 'answer' nor 'entries' field found in the structured API response: %s", response_data)
+    return {"_error": "Neither 'answer' nor 'entries' field in API response", "_confidence_processing_failed": True}
+
+def _classify_structured_response(response_data: Dict[str, Any]) -> str:
+    """
+    Name of the _STRUCTURED_RESPONSE_HANDLERS entry for a structured extraction response
+    """
+    answer = response_data.get("answer")
+    if isinstance(answer, dict):
+        # Check for 'fields' array format first
+        return "answer_fields" if isinstance(answer.get("fields"), list) else "answer_dict"
+    if isinstance(answer, str):
+        return "answer_str"
+    if response_data.get("entries"):
+        return "entries"
+    return "unrecognized"
+
+# Structured extraction response formats and their processing functions
+_STRUCTURED_RESPONSE_HANDLERS = {
+    "answer_fields": _process_answer_fields,
+    "answer_dict": _process_answer_dict,
+    "answer_str": _process_answer_str,
+    "entries": _process_entries,
+    "unrecognized": _process_unrecognized
+}
+
+def _extract_freeform(file_id: str, headers: Dict[str, str], prompt: str, ai_model: str,
+                      cache_key: Optional[str]) -> Dict[str, Any]:
+    """
+    Run freeform extraction for one file, process the Box AI response and cache it
+    
+    Args:
+        file_id: Box file ID
+        headers: Request headers including authorization
+        prompt: Extraction prompt
+        ai_model: AI model to use for extraction
+        cache_key: Result cache key from _extraction_cache_key, or None to skip caching
+        
+    Returns:
+        dict: Extracted metadata with confidence scores, or an "error" entry
+    """
+    # Enhance the prompt to request confidence levels
+    enhanced_prompt = prompt
+    if not "confidence" in prompt.lower():
+        enhanced_prompt = prompt + " For each extracted field, provide your confidence level (High, Medium, or Low) in the accuracy of the extraction. Format your response as a JSON object with each field having a nested object containing 'value' and 'confidence' keys."
+
+    # Create items array with file ID
+    items = [{"id": file_id, "type": "file"}]
+
+    # Construct request body
+    request_body = {
+        "items": items,
+        "prompt": enhanced_prompt,
+        "ai_agent": _freeform_ai_agent(ai_model)
+    }
+
+    # Make API call
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Box AI freeform extraction request: %s", json_dumps(request_body).decode("utf-8"))
+    logger.info("Making Box AI API call for freeform extraction: file=%s", file_id)
+    response = http_session.post(FREEFORM_EXTRACT_URL, headers=headers, json=request_body, timeout=BOX_AI_TIMEOUT)
+
+    # Check response
+    if response.status_code != 200:
+        logger.error("Box AI API error response: %s", response.content[:ERROR_BODY_LOG_LIMIT].decode("utf-8", "replace"))
+        return {"error": f"Error in Box AI API call: {response.status_code} {response.reason}"}
+
+    # Parse response
+    response_data = json_loads(response.content)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw Box AI freeform extraction response data: %s", json_dumps(response_data).decode("utf-8"))
+
+    # Process the response to extract confidence levels; every format goes through
+    # _process_key_value_answer, so fields are coerced the same way as structured answers
+    # *** MODIFIED LOGIC TO HANDLE BOTH RESPONSE FORMATS ***
+    # First check for 'answer' field (new format)
+    if "answer" in response_data:
+        if isinstance(response_data["answer"], str):
+            # Answer is a string, try to parse JSON from it
+            logger.info("Processing freeform 'answer' as string.")
+            response_text = response_data["answer"]
+            parsed_json, parse_error = _parse_embedded_json(response_text)
+
+            if parsed_json is not None:
+                processed_response = _process_key_value_answer(parsed_json)
+            else:
+                # No JSON found, store raw text
+                logger.warning("No JSON object parsed from freeform 'answer' string: %s", parse_error)
+                processed_response = {"_raw_response": response_text, "_confidence_processing_failed": True}
+
+        elif isinstance(response_data["answer"], dict):
+            # Answer is already a dictionary, process directly (same structure as structured)
+            logger.info("Processing freeform 'answer' as dictionary.")
+            processed_response = _process_key_value_answer(response_data["answer"])
+        else:
+            logger.warning("Unexpected freeform 'answer' format: %s", response_data['answer'])
+            processed_response = {"_error": "Unexpected freeform 'answer' format", "_confidence_processing_failed": True}
+
+    # Fall back to entries format if answer is not present (for backward compatibility)
+    elif "entries" in response_data and len(response_data["entries"]) > 0:
+        logger.info("Processing freeform response using fallback 'entries' format.")
+        # Get the first entry
+        entry = response_data["entries"][0]
+
+        # Check if we have a response field
+        if "response" in entry:
+            response_text = entry["response"]
+            parsed_json, parse_error = _parse_embedded_json(response_text)
+
+            if parsed_json is not None:
+                processed_response = _process_key_value_answer(parsed_json)
+            else:
+                # If parsing failed or no JSON found, store the raw response text
+                logger.warning("No JSON object parsed from 'entries' response string: %s", parse_error)
+                processed_response = {"_raw_response": response_text, "_confidence_processing_failed": True}
+        else:
+            # No 'response' field in the entry
+            logger.warning("No 'response' field found in the freeform API entry: %s", entry)
+            processed_response = {"_error": "No 'response' field in API entry", "_confidence_processing_failed": True}
+    else:
+        # Neither 'answer' nor 'entries' found
+        logger.warning("Neither 'answer' nor 'entries' field found in the freeform API response: %s", response_data)
+        processed_response = {"_error": "Neither 'answer' nor 'entries' field in API response", "_confidence_processing_failed": True}
+    # *** END OF MODIFIED LOGIC ***
+
+    _extraction_cache_set(cache_key, processed_response)
+
+    # Return the processed response
+    return processed_response
+
+def _encode_structured_body(file_id: str, encoded_template: bytes) -> bytes:
+    """
+    Encoded request body for one file: its "items" entry spliced in front of the
+    encoded body template, so the template (with its long system messages) is
+    serialized once per extraction spec rather than once per file
+    """
+    return b'{"items":[{"id":' + json_dumps(file_id) + b',"type":"file"}],' + encoded_template[1:]
+
+def _extract_structured(file_id: str, access_token: str, encoded_template: bytes,
+                        spec_digest: str) -> Dict[str, Any]:
+    """
+    Run structured extraction for one file and process the Box AI response,
+    reusing a cached result for the same caller, file version and extraction spec
+    
+    Args:
+        file_id: Box file ID
+        access_token: Box access token
+        encoded_template: Encoded request body from _build_structured_body_template
+        spec_digest: Digest of the template or fields and model, for the result cache
+        
+    Returns:
+        dict: Extracted metadata with confidence scores, or an "error" entry
+    """
+    headers = box_ai_headers(access_token)
+    cache_key = _extraction_cache_key(file_id, spec_digest, access_token)
+    if cache_key is None:
+        return _request_structured(file_id, headers, encoded_template, None)
+    cached = _extraction_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Using cached structured extraction result for file {file_id}")
+        return cached
+    
+    # Coalesce with an identical extraction already in flight
+    return _single_flight(cache_key, lambda: _request_structured(file_id, headers, encoded_template, cache_key))
+
+def _request_structured(file_id: str, headers: Dict[str, str], encoded_template: bytes,
+                        cache_key: Optional[str]) -> Dict[str, Any]:
+    """
+    Call Box AI structured extraction for one file, process the response and cache it
+    """
+    request_body = _encode_structured_body(file_id, encoded_template)
+    
+    # Make API call
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Box AI structured extraction request: %s", request_body.decode("utf-8"))
+    logger.info("Making Box AI API call for structured extraction: file=%s", file_id)
+    response = http_session.post(STRUCTURED_EXTRACT_URL, headers=headers, data=request_body, timeout=BOX_AI_TIMEOUT)
+    
+    # Check response
+    if response.status_code != 200:
+        logger.error("Box AI API error response: %s", response.content[:ERROR_BODY_LOG_LIMIT].decode("utf-8", "replace"))
+        return {"error": f"Error in Box AI API call: {response.status_code} {response.reason}"}
+    
+    # Parse response
+    response_data = json_loads(response.content)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw Box AI structured extraction response data: %s", json_dumps(response_data).decode("utf-8"))
+    
+    # Process the response to extract confidence levels
+    processed_response = _STRUCTURED_RESPONSE_HANDLERS[_classify_structured_response(response_data)](response_data)
+    
+    _extraction_cache_set(cache_key, processed_response)
+    
+    # Return the processed response
+    return processed_response
+
 def metadata_extraction():
     """
     Implement metadata extraction using Box AI API
@@ -31,298 +595,57 @@ def metadata_extraction():
             dict: Extracted metadata with confidence scores
         """
         try:
-            # Get client from session state
-            client = st.session_state.client
-            
-            # Get access token from client
-            access_token = None
-            if hasattr(client, "_oauth"):
-                access_token = client._oauth.access_token
-            elif hasattr(client, "auth") and hasattr(client.auth, "access_token"):
-                access_token = client.auth.access_token
-            
-            if not access_token:
-                raise ValueError("Could not retrieve access token from client")
-            
-            # Set headers
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            # Create AI agent configuration with proper format for structured extraction
-            # Enhanced with confidence scoring instructions
-            ai_agent = {
-                "type": "ai_agent_extract_structured",
-                "long_text": {
-                    "model": ai_model,
-                    "mode": "default",
-                    "system_message": "You are an AI assistant specialized in extracting metadata from documents based on provided field definitions. For each field, analyze the document content and extract the corresponding value. CRITICALLY IMPORTANT: Respond for EACH field with a JSON object containing two keys: 1. \\\"value\\\": The extracted metadata value as a string. 2. \\\"confidence\\\": Your confidence level for this specific extraction, chosen from ONLY these three options: \\\"High\\\", \\\"Medium\\\", or \\\"Low\\\". Base your confidence on how certain you are about the extracted value given the document content and field definition. Example Response for a field: {\\\"value\\\": \\\"INV-12345\\\", \\\"confidence\\\": \\\"High\\\"}"
-                },
-                "basic_text": {
-                    "model": ai_model,
-                    "mode": "default",
-                    "system_message": "You are an AI assistant specialized in extracting metadata from documents based on provided field definitions. For each field, analyze the document content and extract the corresponding value. CRITICALLY IMPORTANT: Respond for EACH field with a JSON object containing two keys: 1. \\\"value\\\": The extracted metadata value as a string. 2. \\\"confidence\\\": Your confidence level for this specific extraction, chosen from ONLY these three options: \\\"High\\\", \\\"Medium\\\", or \\\"Low\\\". Base your confidence on how certain you are about the extracted value given the document content and field definition. Example Response for a field: {\\\"value\\\": \\\"INV-12345\\\", \\\"confidence\\\": \\\"High\\\"}"
-                }
-            }
+            # Read the client from session state once and pass only its token on
+            access_token = get_access_token(st.session_state.get("client"))
             
-            # Create items array with file ID
-            items = [{"id": file_id, "type": "file"}]
-            
-            # Construct API URL for Box AI Extract Structured
-            api_url = "https://api.box.com/2.0/ai/extract_structured"
-            
-            # Construct request body
-            request_body = {
-                "items": items,
-                "ai_agent": ai_agent
-            }
-            
-            # Add template or fields
-            if metadata_template:
-                request_body["metadata_template"] = metadata_template
-            elif fields:
-                # Convert fields to Box API format if needed
-                api_fields = []
-                for field in fields:
-                    if "key" in field:
-                        # Field is already in Box API format
-                        api_fields.append(field)
-                    else:
-                        # Convert field to Box API format
-                        api_field = {
-                            "key": field.get("name", ""),
-                            "displayName": field.get("display_name", field.get("name", "")),
-                            "type": field.get("type", "string")
-                        }
-                        
-                        # Add description and prompt if available
-                        if "description" in field:
-                            api_field["description"] = field["description"]
-                        if "prompt" in field:
-                            api_field["prompt"] = field["prompt"]
-                        
-                        # Add options for enum fields
-                        if field.get("type") == "enum" and "options" in field:
-                            api_field["options"] = field["options"]
-                        
-                        api_fields.append(api_field)
-                
-                request_body["fields"] = api_fields
-            else:
-                raise ValueError("Either fields or metadata_template must be provided")
-            
-            # Make API call
-            logger.info(f"Making Box AI API call for structured extraction with request: {json.dumps(request_body)}")
-            response = requests.post(api_url, headers=headers, json=request_body)
-            
-            # Check response
-            if response.status_code != 200:
-                logger.error(f"Box AI API error response: {response.text}")
-                return {"error": f"Error in Box AI API call: {response.status_code} {response.reason}"}
-            
-            # Parse response
-            response_data = response.json()
-            logger.info(f"Raw Box AI structured extraction response data: {json.dumps(response_data)}") # Added logging
-            
-            # Process the response to extract confidence levels
-            processed_response = {}
-            
-            # *** REVISED LOGIC TO HANDLE DIFFERENT RESPONSE FORMATS ***
-            if "answer" in response_data and isinstance(response_data["answer"], dict):
-                answer_dict = response_data["answer"]
-                
-                # Check for 'fields' array format FIRST
-                if "fields" in answer_dict and isinstance(answer_dict["fields"], list):
-                    logger.info("Processing 'answer' with 'fields' array format.")
-                    fields_array = answer_dict["fields"]
-                    for field_item in fields_array:
-                        if isinstance(field_item, dict) and "key" in field_item and "value" in field_item:
-                            field_key = field_item["key"]
-                            extracted_value = field_item["value"]
-                            # Get confidence if available, otherwise default to Medium
-                            confidence_level = field_item.get("confidence", "Medium")
-                            
-                            # Validate confidence value
-                            if confidence_level not in ["High", "Medium", "Low"]:
-                                logger.warning(f"Field {field_key}: Unexpected confidence value '{confidence_level}', defaulting to Medium.")
-                                confidence_level = "Medium"
-                                
-                            # Store the extracted value and confidence
-                            processed_response[field_key] = extracted_value
-                            processed_response[f"{field_key}_confidence"] = confidence_level
-                        else:
-                            logger.warning(f"Skipping invalid item in 'fields' array: {field_item}")
-                
-                # Else, process as standard key-value pairs
-                else:
-                    logger.info("Processing 'answer' as standard key-value dictionary.")
-                    for field_key, field_data in answer_dict.items():
-                        # Default values
-                        extracted_value = None
-                        confidence_level = "Medium" # Default if parsing fails or not provided
-
-                        try:
-                            # Check if field_data is a dictionary with 'value' and 'confidence'
-                            if isinstance(field_data, dict) and "value" in field_data and "confidence" in field_data:
-                                extracted_value = field_data["value"]
-                                confidence_level = field_data["confidence"]
-                                
-                                # Validate confidence value
-                                if confidence_level not in ["High", "Medium", "Low"]:
-                                    logger.warning(f"Field {field_key}: Unexpected confidence value '{confidence_level}', defaulting to Medium.")
-                                    confidence_level = "Medium"
-                            
-                            # Handle cases where field_data might be None
-                            elif field_data is None:
-                                logger.info(f"Field {field_key}: Received null value. Setting value to None and confidence to Low.")
-                                extracted_value = None
-                                confidence_level = "Low"
-                            
-                            # Handle cases where field_data is a dict with only 'value'
-                            elif isinstance(field_data, dict) and "value" in field_data and len(field_data) == 1:
-                                logger.warning(f"Field {field_key}: Found dict with only 'value' key: {field_data}. Extracting value directly.")
-                                extracted_value = field_data["value"]
-                                confidence_level = "Medium" # Default confidence as it was missing
-                            
-                            # Otherwise treat the whole field_data as the value
-                            else:
-                                logger.warning(f"Field {field_key}: Unexpected data format: {field_data}. Using raw data as value and Medium confidence.")
-                                extracted_value = field_data # Use the raw data
-                                confidence_level = "Medium"
-
-                            # Store the extracted value and confidence
-                            processed_response[field_key] = extracted_value
-                            processed_response[f"{field_key}_confidence"] = confidence_level
-
-                        except Exception as e:
-                            logger.error(f"Error processing field {field_key} with data '{field_data}': {str(e)}")
-                            processed_response[field_key] = field_data # Store original data on error
-                            processed_response[f"{field_key}_confidence"] = "Low" # Low confidence due to processing error
-            
-            # Handle freeform response format (string in 'answer')
-            elif "answer" in response_data and isinstance(response_data["answer"], str):
-                 logger.info("Processing 'answer' as string (potential freeform JSON).")
-                 response_text = response_data["answer"]
-                 # Try to parse JSON from the text
-                 try:
-                     # Look for JSON-like content in the string
-                     json_start = response_text.find('{')
-                     json_end = response_text.rfind('}') + 1
-                     
-                     if json_start != -1 and json_end > json_start:
-                         json_str = response_text[json_start:json_end]
-                         parsed_json = json.loads(json_str)
-                         
-                         if isinstance(parsed_json, dict):
-                             # Process each field in the parsed JSON
-                             for field_key, field_data in parsed_json.items():
-                                 if isinstance(field_data, dict) and "value" in field_data and "confidence" in field_data:
-                                     # Extract value and confidence
-                                     extracted_value = field_data["value"]
-                                     confidence_level = field_data["confidence"]
-                                     
-                                     # Validate confidence
-                                     if confidence_level not in ["High", "Medium", "Low"]:
-                                         confidence_level = "Medium"
-                                         
-                                     # Store in processed response
-                                     processed_response[field_key] = extracted_value
-                                     processed_response[f"{field_key}_confidence"] = confidence_level
-                                 else:
-                                     # Use the field_data as is with Medium confidence
-                                     processed_response[field_key] = field_data
-                                     processed_response[f"{field_key}_confidence"] = "Medium"
-                         else:
-                             # Not a dictionary, store raw text
-                             logger.warning(f"Parsed JSON from 'answer' string is not a dictionary: {parsed_json}")
-                             processed_response["_raw_response"] = response_text
-                             processed_response["_confidence_processing_failed"] = True
-                     else:
-                         # No JSON found, store raw text
-                         logger.warning("No JSON object found in 'answer' string.")
-                         processed_response["_raw_response"] = response_text
-                         processed_response["_confidence_processing_failed"] = True
-                 except Exception as e:
-                     logger.error(f"Error parsing JSON from answer string: {str(e)}")
-                     processed_response["_raw_response"] = response_text
-                     processed_response["_confidence_processing_failed"] = True
-            
-            # Fall back to entries format if answer is not present (for backward compatibility)
-            elif "entries" in response_data and len(response_data["entries"]) > 0:
-                logger.info("Processing response using fallback 'entries' format.")
-                # Get the first entry (should be our file)
-                entry = response_data["entries"][0]
-                
-                # Check if we have metadata fields
-                if "metadata" in entry:
-                    metadata = entry["metadata"]
-                    
-                    # Process each field to extract value and confidence
-                    for field_key, field_value in metadata.items():
-                        # Default values
-                        extracted_value = field_value
-                        confidence_level = "Medium" # Default if parsing fails or not provided
-
-                        try:
-                            # Check if field_value is a string that looks like our requested JSON
-                            if isinstance(field_value, str) and field_value.strip().startswith('{') and field_value.strip().endswith('}'):
-                                try:
-                                    # Attempt to parse as JSON
-                                    parsed_value = json.loads(field_value)
-                                    if isinstance(parsed_value, dict) and "value" in parsed_value and "confidence" in parsed_value:
-                                        # Successfully parsed the expected JSON structure
-                                        extracted_value = parsed_value["value"]
-                                        confidence_level = parsed_value["confidence"]
-                                        # Validate confidence value
-                                        if confidence_level not in ["High", "Medium", "Low"]:
-                                            logger.warning(f"Field {field_key}: Unexpected confidence value '{confidence_level}', defaulting to Medium.")
-                                            confidence_level = "Medium"
-                                    else:
-                                        # Parsed JSON but not the expected structure
-                                        logger.warning(f"Field {field_key}: Parsed JSON but keys 'value' and 'confidence' not found. Using raw value.")
-                                        extracted_value = field_value # Keep original string
-                                        confidence_level = "Medium" # Default confidence
-                                except json.JSONDecodeError:
-                                    # String looked like JSON but failed to parse
-                                    logger.warning(f"Field {field_key}: Failed to parse potential JSON value '{field_value}'. Using raw value.")
-                                    extracted_value = field_value # Keep original string
-                                    confidence_level = "Medium" # Default confidence
-                            else:
-                                # field_value is not a string or doesn't look like JSON
-                                # Assume the value is the direct extraction result
-                                extracted_value = field_value
-                                # We didn't get confidence in the expected format, default to Medium
-                                confidence_level = "Medium"
-                                logger.info(f"Field {field_key}: Value is not the expected JSON format. Using raw value and Medium confidence.")
-
-                            # Store the extracted value and confidence
-                            processed_response[field_key] = extracted_value
-                            processed_response[f"{field_key}_confidence"] = confidence_level
-
-                        except Exception as e:
-                            logger.error(f"Error processing field {field_key} with value '{field_value}': {str(e)}")
-                            processed_response[field_key] = field_value # Store original value on error
-                            processed_response[f"{field_key}_confidence"] = "Low" # Low confidence due to processing error
-                else:
-                    logger.warning(f"No 'metadata' field found in the structured API entry: {entry}")
-                    processed_response["_error"] = "No 'metadata' field in API entry"
-                    processed_response["_confidence_processing_failed"] = True
-            
-            # Original error case if neither 'answer' nor 'entries' is found
-            else:
-                logger.warning(f"Neither 'answer' nor 'entries' field found in the structured API response: {response_data}")
-                processed_response["_error"] = "Neither 'answer' nor 'entries' field in API response"
-                processed_response["_confidence_processing_failed"] = True
-            # *** END OF REVISED LOGIC ***
-            
-            # Return the processed response
-            return processed_response
+            encoded_template = json_dumps(_build_structured_body_template(fields, metadata_template, ai_model))
+            spec_digest = _extraction_spec_digest(tpl=metadata_template, fields=fields, model=ai_model)
+            return _extract_structured(file_id, access_token, encoded_template, spec_digest)
         
         except Exception as e:
             logger.error(f"Error in structured metadata extraction call: {str(e)}")
             return {"error": str(e)}
     
+    # Structured metadata extraction for many files at once
+    def extract_structured_metadata_batch(file_ids, fields=None, metadata_template=None, ai_model="azure__openai__gpt_4o_mini",
+                                          max_workers=MAX_EXTRACTION_WORKERS):
+        """
+        Extract structured metadata from several files concurrently using Box AI API.
+        The access token and request body are built once on the calling thread, so
+        workers never touch session state.
+        
+        Args:
+            file_ids (list): Box file IDs
+            fields (list): List of field definitions for extraction
+            metadata_template (dict): Metadata template definition
+            ai_model (str): AI model to use for extraction
+            max_workers (int): Maximum number of concurrent Box AI calls
+            
+        Returns:
+            dict: Results of extract_structured_metadata keyed by file ID
+        """
+        try:
+            # Session state is only read here, on the calling thread
+            access_token = get_access_token(st.session_state.get("client"))
+            # Build and encode the request body once; only "items" differs per file
+            encoded_template = json_dumps(_build_structured_body_template(fields, metadata_template, ai_model))
+            spec_digest = _extraction_spec_digest(tpl=metadata_template, fields=fields, model=ai_model)
+        except Exception as e:
+            logger.error(f"Error in structured metadata extraction call: {str(e)}")
+            return {file_id: {"error": str(e)} for file_id in file_ids}
+        
+        def _call_one(file_id):
+            try:
+                return _extract_structured(file_id, access_token, encoded_template, spec_digest)
+            except Exception as e:
+                logger.error(f"Error in structured metadata extraction call for file {file_id}: {str(e)}")
+                return {"error": str(e)}
+        
+        if not file_ids:
+            return {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_ids)))) as executor:
+            return dict(zip(file_ids, executor.map(_call_one, file_ids)))
+    
     # Freeform metadata extraction
     def extract_freeform_metadata(file_id, prompt, ai_model="azure__openai__gpt_4o_mini"):
         """
@@ -337,229 +660,20 @@ def metadata_extraction():
             dict: Extracted metadata with confidence scores
         """
         try:
-            # Get client from session state
-            client = st.session_state.client
-            
-            # Get access token from client
-            access_token = None
-            if hasattr(client, "_oauth"):
-                access_token = client._oauth.access_token
-            elif hasattr(client, "auth") and hasattr(client.auth, "access_token"):
-                access_token = client.auth.access_token
-            
-            if not access_token:
-                raise ValueError("Could not retrieve access token from client")
-            
-            # Set headers
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            # Enhance the prompt to request confidence levels
-            enhanced_prompt = prompt
-            if not "confidence" in prompt.lower():
-                enhanced_prompt = prompt + " For each extracted field, provide your confidence level (High, Medium, or Low) in the accuracy of the extraction. Format your response as a JSON object with each field having a nested object containing 'value' and 'confidence' keys."
-            
-            # Create AI agent configuration with confidence scoring instructions
-            ai_agent = {
-                "type": "ai_agent_extract",
-                "long_text": {
-                    "model": ai_model,
-                    "system_message": "You are an AI assistant specialized in extracting metadata from documents. Extract the requested information and for EACH extracted field, provide both the value and your confidence level (High, Medium, or Low). Format your response as a JSON object where each field has a nested object containing \\\"value\\\" and \\\"confidence\\\" keys. Example: {\\\"InvoiceNumber\\\": {\\\"value\\\": \\\"INV-12345\\\", \\\"confidence\\\": \\\"High\\\"}, \\\"Date\\\": {\\\"value\\\": \\\"2023-04-15\\\", \\\"confidence\\\": \\\"Medium\\\"}}"
-                },
-                "basic_text": {
-                    "model": ai_model,
-                    "system_message": "You are an AI assistant specialized in extracting metadata from documents. Extract the requested information and for EACH extracted field, provide both the value and your confidence level (High, Medium, or Low). Format your response as a JSON object where each field has a nested object containing \\\"value\\\" and \\\"confidence\\\" keys. Example: {\\\"InvoiceNumber\\\": {\\\"value\\\": \\\"INV-12345\\\", \\\"confidence\\\": \\\"High\\\"}, \\\"Date\\\": {\\\"value\\\": \\\"2023-04-15\\\", \\\"confidence\\\": \\\"Medium\\\"}}"
-                }
-            }
-            
-            # Create items array with file ID
-            items = [{"id": file_id, "type": "file"}]
-            
-            # Construct API URL for Box AI Extract
-            api_url = "https://api.box.com/2.0/ai/extract"
-            
-            # Construct request body
-            request_body = {
-                "items": items,
-                "prompt": enhanced_prompt,
-                "ai_agent": ai_agent
-            }
-            
-            # Make API call
-            logger.info(f"Making Box AI API call for freeform extraction with request: {json.dumps(request_body)}")
-            response = requests.post(api_url, headers=headers, json=request_body)
-            
-            # Check response
-            if response.status_code != 200:
-                logger.error(f"Box AI API error response: {response.text}")
-                return {"error": f"Error in Box AI API call: {response.status_code} {response.reason}"}
-            
-            # Parse response
-            response_data = response.json()
-            logger.info(f"Raw Box AI freeform extraction response data: {json.dumps(response_data)}") # Added logging
-            
-            # Process the response to extract confidence levels
-            processed_response = {}
-            
-            # *** MODIFIED LOGIC TO HANDLE BOTH RESPONSE FORMATS ***
-            # First check for 'answer' field (new format)
-            if "answer" in response_data:
-                if isinstance(response_data["answer"], str):
-                    # Answer is a string, try to parse JSON from it
-                    logger.info("Processing freeform 'answer' as string.")
-                    response_text = response_data["answer"]
-                    parsed_successfully = False
-                    
-                    try:
-                        # Look for JSON-like content in the string
-                        json_start = response_text.find('{')
-                        json_end = response_text.rfind('}') + 1
-                        
-                        if json_start != -1 and json_end > json_start:
-                            json_str = response_text[json_start:json_end]
-                            parsed_json = json.loads(json_str)
-                            
-                            if isinstance(parsed_json, dict):
-                                # Process each field in the parsed JSON
-                                for field_key, field_data in parsed_json.items():
-                                    if isinstance(field_data, dict) and "value" in field_data and "confidence" in field_data:
-                                        # Extract value and confidence
-                                        extracted_value = field_data["value"]
-                                        confidence_level = field_data["confidence"]
-                                        
-                                        # Validate confidence
-                                        if confidence_level not in ["High", "Medium", "Low"]:
-                                            confidence_level = "Medium"
-                                            
-                                        # Store in processed response
-                                        processed_response[field_key] = extracted_value
-                                        processed_response[f"{field_key}_confidence"] = confidence_level
-                                    else:
-                                        # Use the field_data as is with Medium confidence
-                                        processed_response[field_key] = field_data
-                                        processed_response[f"{field_key}_confidence"] = "Medium"
-                                parsed_successfully = True
-                            else:
-                                # Not a dictionary, store raw text
-                                logger.warning(f"Parsed JSON from freeform 'answer' string is not a dictionary: {parsed_json}")
-                        else:
-                            # No JSON found, store raw text
-                            logger.warning(f"No JSON object found in freeform 'answer' string.")
-                            
-                        if not parsed_successfully:
-                            processed_response["_raw_response"] = response_text
-                            processed_response["_confidence_processing_failed"] = True
-                    except Exception as e:
-                        logger.error(f"Error parsing JSON from freeform answer string: {str(e)}")
-                        processed_response["_raw_response"] = response_text
-                        processed_response["_confidence_processing_failed"] = True
-                
-                elif isinstance(response_data["answer"], dict):
-                    # Answer is already a dictionary, process directly (assuming same structure as structured)
-                    logger.info("Processing freeform 'answer' as dictionary.")
-                    for field_key, field_data in response_data["answer"].items():
-                        if isinstance(field_data, dict) and "value" in field_data and "confidence" in field_data:
-                            # Extract value and confidence
-                            extracted_value = field_data["value"]
-                            confidence_level = field_data["confidence"]
-                            
-                            # Validate confidence
-                            if confidence_level not in ["High", "Medium", "Low"]:
-                                confidence_level = "Medium"
-                                
-                            # Store in processed response
-                            processed_response[field_key] = extracted_value
-                            processed_response[f"{field_key}_confidence"] = confidence_level
-                        # Handle dict with only 'value'
-                        elif isinstance(field_data, dict) and "value" in field_data and len(field_data) == 1:
-                            extracted_value = field_data["value"]
-                            confidence_level = "Medium"
-                            processed_response[field_key] = extracted_value
-                            processed_response[f"{field_key}_confidence"] = confidence_level
-                        else:
-                            # Use the field_data as is with Medium confidence
-                            processed_response[field_key] = field_data
-                            processed_response[f"{field_key}_confidence"] = "Medium"
-                else:
-                    logger.warning(f"Unexpected freeform 'answer' format: {response_data['answer']}")
-                    processed_response["_error"] = "Unexpected freeform 'answer' format"
-                    processed_response["_confidence_processing_failed"] = True
-            
-            # Fall back to entries format if answer is not present (for backward compatibility)
-            elif "entries" in response_data and len(response_data["entries"]) > 0:
-                logger.info("Processing freeform response using fallback 'entries' format.")
-                # Get the first entry
-                entry = response_data["entries"][0]
-                
-                # Check if we have a response field
-                if "response" in entry:
-                    response_text = entry["response"]
-                    parsed_successfully = False
-
-                    # Try to parse the response text as JSON
-                    try:
-                        # Attempt to find and parse JSON within the response text
-                        json_start = response_text.find('{')
-                        json_end = response_text.rfind('}') + 1
-
-                        if json_start != -1 and json_end > json_start:
-                            json_str = response_text[json_start:json_end]
-                            parsed_json = json.loads(json_str)
-
-                            if isinstance(parsed_json, dict):
-                                # Successfully parsed a JSON object
-                                for field_key, field_data in parsed_json.items():
-                                    if isinstance(field_data, dict) and "value" in field_data and "confidence" in field_data:
-                                        # Found the expected nested structure
-                                        extracted_value = field_data["value"]
-                                        confidence_level = field_data["confidence"]
-                                        # Validate confidence
-                                        if confidence_level not in ["High", "Medium", "Low"]:
-                                            logger.warning(f"Field {field_key}: Unexpected confidence value '{confidence_level}', defaulting to Medium.")
-                                            confidence_level = "Medium"
-
-                                        processed_response[field_key] = extracted_value
-                                        processed_response[f"{field_key}_confidence"] = confidence_level
-                                    else:
-                                        # Field data is not the expected nested dict
-                                        logger.warning(f"Field {field_key}: Unexpected structure in parsed JSON: {field_data}. Storing as is with Medium confidence.")
-                                        processed_response[field_key] = field_data # Store whatever was returned
-                                        processed_response[f"{field_key}_confidence"] = "Medium"
-                                parsed_successfully = True
-                            else:
-                                # Parsed JSON but it's not a dictionary (e.g., a list)
-                                logger.warning(f"Parsed JSON from 'entries' response string is not a dictionary: {json_str}. Storing raw response.")
-                        else:
-                            # No JSON object found in the response text
-                            logger.warning(f"No JSON object found in 'entries' response string. Storing raw response.")
-
-                    except json.JSONDecodeError as e:
-                        # Failed to parse the potential JSON string
-                        logger.warning(f"Failed to parse JSON from 'entries' response string. Error: {e}. Storing raw response.")
-                    except Exception as e:
-                        # General error during parsing
-                        logger.error(f"Error processing freeform 'entries' response. Error: {e}. Storing raw response.")
-
-                    # If parsing failed or no JSON found, store the raw response text
-                    if not parsed_successfully:
-                        processed_response["_raw_response"] = response_text
-                        processed_response["_confidence_processing_failed"] = True # Indicate failure
-                else:
-                    # No 'response' field in the entry
-                    logger.warning(f"No 'response' field found in the freeform API entry: {entry}")
-                    processed_response["_error"] = "No 'response' field in API entry"
-                    processed_response["_confidence_processing_failed"] = True
-            else:
-                # Neither 'answer' nor 'entries' found
-                logger.warning(f"Neither 'answer' nor 'entries' field found in the freeform API response: {response_data}")
-                processed_response["_error"] = "Neither 'answer' nor 'entries' field in API response"
-                processed_response["_confidence_processing_failed"] = True
-            # *** END OF MODIFIED LOGIC ***
-            
-            # Return the processed response
-            return processed_response
+            # Read the client from session state once and pass only its token on
+            access_token = get_access_token(st.session_state.get("client"))
+            headers = box_ai_headers(access_token)
+            
+            cache_key = _extraction_cache_key(file_id, _extraction_spec_digest(prompt=prompt, model=ai_model), access_token)
+            if cache_key is None:
+                return _extract_freeform(file_id, headers, prompt, ai_model, None)
+            cached = _extraction_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Using cached freeform extraction result for file {file_id}")
+                return cached
+            
+            # Coalesce with an identical extraction already in flight
+            return _single_flight(cache_key, lambda: _extract_freeform(file_id, headers, prompt, ai_model, cache_key))
         
         except Exception as e:
             logger.error(f"Error in freeform metadata extraction call: {str(e)}")
@@ -568,6 +682,7 @@ def metadata_extraction():
     # Return dictionary of functions
     return {
         "extract_structured_metadata": extract_structured_metadata,
+        "extract_structured_metadata_batch": extract_structured_metadata_batch,
         "extract_freeform_metadata": extract_freeform_metadata
     }
 
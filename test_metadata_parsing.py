@@ -0,0 +1,157 @@
+"""
+Test script for the Box AI answer parsing helpers in modules.metadata_extraction.
+
+This script feeds sample answers through the parsing helpers to verify that embedded
+JSON, confidence levels, null fields and the structured response formats are handled.
+"""
+
+import logging
+import sys
+import os
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Add the repository root to sys.path to import the module
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.metadata_extraction import (
+    _parse_embedded_json,
+    _coerce_field,
+    _process_key_value_answer,
+    _classify_structured_response,
+    _STRUCTURED_RESPONSE_HANDLERS
+)
+
+def test_parse_embedded_json():
+    """Test parsing of JSON objects embedded in answer text"""
+    # Answer that is only the object
+    assert _parse_embedded_json('{"title": "Annual Report"}') == ({"title": "Annual Report"}, None)
+
+    # Object surrounded by prose
+    assert _parse_embedded_json('Here you go: {"title": "Annual Report"} Done.') == ({"title": "Annual Report"}, None)
+
+    # Prose after the object containing a '}' falls back to the first complete object
+    parsed, error = _parse_embedded_json('Result: {"value": 906.9} (see note}')
+    assert parsed == {"value": 906.9}
+    assert error is None
+
+    # Nested objects
+    parsed, error = _parse_embedded_json('{"title": {"value": "Report", "confidence": "High"}}')
+    assert parsed == {"title": {"value": "Report", "confidence": "High"}}
+
+    # Failures carry a reason
+    assert _parse_embedded_json(None) == (None, "not_text")
+    assert _parse_embedded_json("no json here") == (None, "no_json")
+    assert _parse_embedded_json("} backwards {") == (None, "no_json")
+    parsed, error = _parse_embedded_json('{"title": }')
+    assert parsed is None
+    assert error.startswith("decode_error (")
+
+def test_coerce_field():
+    """Test value and confidence level of single key-value answer fields"""
+    assert _coerce_field("title", {"value": "Report", "confidence": "High"}) == ("Report", "High")
+
+    # Missing or invalid confidence defaults to Medium
+    assert _coerce_field("title", {"value": "Report"}) == ("Report", "Medium")
+    assert _coerce_field("title", {"value": "Report", "confidence": "Very High"}) == ("Report", "Medium")
+    assert _coerce_field("title", {"value": "Report", "confidence": 0.9}) == ("Report", "Medium")
+
+    # A null field has no value and Low confidence
+    assert _coerce_field("title", None) == (None, "Low")
+
+    # Anything else is the value itself
+    assert _coerce_field("value", 906.9) == (906.9, "Medium")
+    assert _coerce_field("title", {"text": "Report"}) == ({"text": "Report"}, "Medium")
+
+def test_process_key_value_answer():
+    """Test flattening of key-value answers into values and confidence entries"""
+    processed = _process_key_value_answer({
+        "title": {"value": "Annual Report", "confidence": "High"},
+        "entityName": {"value": "RedR Australia"},
+        "value": None
+    })
+    assert processed == {
+        "title": "Annual Report",
+        "title_confidence": "High",
+        "entityName": "RedR Australia",
+        "entityName_confidence": "Medium",
+        "value": None,
+        "value_confidence": "Low"
+    }
+
+def test_classify_structured_response():
+    """Test detection of the structured extraction response formats"""
+    assert _classify_structured_response({"answer": {"fields": []}}) == "answer_fields"
+    assert _classify_structured_response({"answer": {"title": "Report"}}) == "answer_dict"
+    assert _classify_structured_response({"answer": '{"title": "Report"}'}) == "answer_str"
+    assert _classify_structured_response({"entries": [{"metadata": {}}]}) == "entries"
+    assert _classify_structured_response({"entries": []}) == "unrecognized"
+    assert _classify_structured_response({}) == "unrecognized"
+
+    # Every format has a handler
+    for response_format in ("answer_fields", "answer_dict", "answer_str", "entries", "unrecognized"):
+        assert response_format in _STRUCTURED_RESPONSE_HANDLERS
+
+def test_structured_response_handlers():
+    """Test processing of each structured extraction response format"""
+    def process(response_data):
+        return _STRUCTURED_RESPONSE_HANDLERS[_classify_structured_response(response_data)](response_data)
+
+    # 'fields' array with a missing and an invalid confidence, and an invalid item
+    processed = process({"answer": {"fields": [
+        {"key": "title", "value": "Report", "confidence": "High"},
+        {"key": "value", "value": 126},
+        {"key": "keywords", "value": "training", "confidence": "certain"},
+        {"value": "no key"}
+    ]}})
+    assert processed == {
+        "title": "Report", "title_confidence": "High",
+        "value": 126, "value_confidence": "Medium",
+        "keywords": "training", "keywords_confidence": "Medium"
+    }
+
+    # Answer string with JSON followed by prose containing a '}'
+    processed = process({"answer": 'Extracted: {"title": {"value": "Report", "confidence": "Low"}} end}'})
+    assert processed == {"title": "Report", "title_confidence": "Low"}
+
+    # Answer string without JSON keeps the raw text
+    processed = process({"answer": "I could not find any metadata."})
+    assert processed == {"_raw_response": "I could not find any metadata.", "_confidence_processing_failed": True}
+
+    # Older 'entries' format
+    processed = process({"entries": [{"metadata": {
+        "title": '{"value": "Report", "confidence": "High"}',
+        "value": 126
+    }}]})
+    assert processed == {"title": "Report", "title_confidence": "High", "value": 126, "value_confidence": "Medium"}
+
+    processed = process({"error": "bad request"})
+    assert processed["_confidence_processing_failed"] is True
+
+if __name__ == "__main__":
+    # Run test functions
+    tests = [
+        test_parse_embedded_json,
+        test_coerce_field,
+        test_process_key_value_answer,
+        test_classify_structured_response,
+        test_structured_response_handlers
+    ]
+    failed = []
+    for test in tests:
+        try:
+            test()
+        except AssertionError as e:
+            logger.error(f"{test.__name__} failed: {e!r}")
+            failed.append(test.__name__)
+
+    # Print summary
+    print("\n=== TEST RESULTS SUMMARY ===")
+    print(f"Tests passed: {len(tests) - len(failed)}/{len(tests)}")
+    if not failed:
+        print("✅ All parsing tests passed!")
+    else:
+        print(f"❌ Failed: {', '.join(failed)}")